@@ -0,0 +1,106 @@
+# coding: utf-8
+"""Compare memory use and throughput of `Article` against the eager, dict-based implementation
+
+Usage: python benchmarks/bench_article.py [-n 100000]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from inoreader.article import Article
+from inoreader.utils import extract_text, normalize_whitespace
+
+
+class EagerArticle(object):
+    """`Article` before text extraction became lazy"""
+
+    def __init__(
+        self,
+        id,
+        title,
+        categories,
+        link,
+        published=None,
+        content=None,
+        author=None,
+        feed_id=None,
+        feed_title=None,
+        feed_link=None,
+    ):
+        self.id = id
+        self.title = normalize_whitespace(title)
+        self.categories = categories
+        self.link = link
+        self.published = published
+        self.content = content.strip() if content else ""
+        self.text = extract_text(self.content)
+        self.author = author
+        self.feed_id = feed_id
+        self.feed_title = feed_title.strip()
+        self.feed_link = feed_link
+
+
+def make_items(count):
+    content = (
+        "<div><p>Some <b>bold</b> words and a <a href='https://example.com/{0}'>link</a>.</p>"
+        "<img src='https://example.com/{0}.png' alt='image'/><p>{1}</p></div>"
+    )
+    return [
+        {
+            "id": "tag:google.com,2005:reader/item/{:016x}".format(idx),
+            "title": "Article title number {}".format(idx),
+            "categories": ["user/-/state/com.google/reading-list", "user/-/label/news"],
+            "link": "https://example.com/articles/{}".format(idx),
+            "published": 1700000000 + idx,
+            "content": content.format(idx, "lorem ipsum dolor sit amet " * 20),
+            "author": "author",
+            "feed_id": "feed/https://example.com/feed",
+            "feed_title": "Example feed",
+            "feed_link": "https://example.com",
+        }
+        for idx in range(count)
+    ]
+
+
+def run(cls, items, read_text):
+    tracemalloc.start()
+    start = time.perf_counter()
+    articles = [cls(**item) for item in items]
+    for article in articles:
+        article.title
+        if read_text:
+            article.text
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    items = make_items(args.number)
+    print(
+        "{:<14}{:<12}{:>10}{:>16}{:>14}".format(
+            "class", "workload", "secs", "articles/sec", "peak MB"
+        )
+    )
+    for cls in (EagerArticle, Article):
+        for read_text in (False, True):
+            elapsed, peak = run(cls, items, read_text)
+            print(
+                "{:<14}{:<12}{:>10.2f}{:>16.0f}{:>14.1f}".format(
+                    cls.__name__,
+                    "title+text" if read_text else "title",
+                    elapsed,
+                    args.number / elapsed,
+                    peak / 1024 / 1024,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# coding: utf-8
+"""Compare filter rules matched with `findall` on each regex, with `search` on each regex or on
+their alternation, and with the same on the regexes whose required literals are in the text,
+after checking that `PatternMatcher` finds the same patterns
+
+Usage: python benchmarks/bench_filter.py [-r 300] [-a 2000]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from inoreader.filter import PatternMatcher
+
+
+class FindallMatcher(object):
+    """Filters before `PatternMatcher`"""
+
+    def __init__(self, patterns):
+        self.regexps = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+    def search(self, text):
+        for pattern_id, regexp in enumerate(self.regexps):
+            if regexp.findall(text):
+                return pattern_id
+
+        return None
+
+
+def separate(matcher):
+    """Search the patterns of the matcher one by one instead of in an alternation"""
+    matcher.mergeable = [False] * len(matcher.patterns)
+    return matcher
+
+
+def make_rules(count):
+    return [
+        [
+            r"\bkeyword{}\b".format(idx),
+            r"topic{}(s|es)?".format(idx),
+            r"example{}\.(com|org)".format(idx),
+            r"release v?{}\.\d+".format(idx),
+        ]
+        for idx in range(count)
+    ]
+
+
+def make_texts(count, rule_count, words=300):
+    random.seed(0)
+    vocabulary = ["lorem", "ipsum", "dolor", "sit", "amet", "news", "release", "topic", "the"]
+    texts = []
+    for _ in range(count):
+        text = [random.choice(vocabulary) for _ in range(words)]
+        if random.random() < 0.05:
+            text.append("Keyword{}".format(random.randrange(rule_count)))
+        texts.append(" ".join(text))
+
+    return texts
+
+
+def check_matches():
+    """`PatternMatcher` finds what the regexes find, case variants included"""
+    patterns = [r"indirim", r"İndirim", r"ınd", r"straße", r"KELVIN", r"(ſale|Σ)\d+", r"x?y"]
+    texts = ["İNDİRİM", "indirim", "INDIRIM", "ınd", "STRASSE", "Straße", "kelvin", "SALE1"]
+    texts += ["σ2", "ς3", "xy", ""]
+    matcher = PatternMatcher(patterns)
+    regexps = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+    for text in texts:
+        expected = [idx for idx, regexp in enumerate(regexps) if regexp.search(text)]
+        assert matcher.search_all(text) == expected, (text, expected)
+
+
+def run(matchers, texts):
+    start = time.perf_counter()
+    matched = sum(matcher.search(text) is not None for text in texts for matcher in matchers)
+    return time.perf_counter() - start, matched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--rules", type=int, default=300)
+    parser.add_argument("-a", "--articles", type=int, default=2000)
+    args = parser.parse_args()
+
+    check_matches()
+    rules = make_rules(args.rules)
+    texts = make_texts(args.articles, args.rules)
+    print("{:<22}{:>10}{:>12}{:>16}".format("matcher", "secs", "matched", "articles/sec"))
+    for name, build in (
+        ("findall", FindallMatcher),
+        ("search", lambda patterns: separate(PatternMatcher(patterns, prefilter=False))),
+        ("alternation", lambda patterns: PatternMatcher(patterns, prefilter=False)),
+        ("search+literals", lambda patterns: separate(PatternMatcher(patterns))),
+        ("alternation+literals", PatternMatcher),
+    ):
+        elapsed, matched = run([build(patterns) for patterns in rules], texts)
+        print(
+            "{:<22}{:>10.2f}{:>12}{:>16.0f}".format(name, elapsed, matched, args.articles / elapsed)
+        )
+
+
+if __name__ == "__main__":
+    main()
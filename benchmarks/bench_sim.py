@@ -0,0 +1,174 @@
+# coding: utf-8
+"""Compare n-gram tokenization and similarity of titles against the implementation which built
+each level separately and matched each char of each gram with a regex, LCS similarity against
+`SequenceMatcher`, and all pairs of titles scored with `sim_matrix` (if NumPy and SciPy are
+installed) against `cosine_sim` of each pair, in pairs/sec
+
+Usage: python benchmarks/bench_sim.py [-n 2000] [-p 200]
+"""
+
+import argparse
+import random
+import re
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+from math import sqrt
+
+from inoreader.sim import PUNCTS_PAT, LCSMatcher, cosine_sim, make_terms, sim_matrix, tokenize
+
+
+def slow_make_terms(
+    text, term, ngram_range=None, lower=True, ignore_punct=True, gram_as_tuple=False
+):
+    """`make_terms` before it checked punctuation with a lookup table"""
+    if lower:
+        text = text.lower()
+    if term == "word":
+        # term_seq = [word.strip() for word in jieba.cut(text) if word.strip()]
+        term_seq = [word.strip() for word in text.split() if word.strip()]
+    elif term == "char":
+        term_seq = list(re.sub(r"\s", "", text))
+    else:
+        raise ValueError(f"unsupported term type: {term}")
+
+    if ngram_range and not (len(ngram_range) == 2 and ngram_range[0] < ngram_range[1]):
+        raise ValueError(f"wrong `ngram_range`: {ngram_range}")
+
+    terms = []
+    min_ngram, max_ngram = ngram_range or (1, 2)
+    for idx in range(0, max(1, len(term_seq) - min_ngram + 1)):
+        cur_grams = []
+        for gram_level in range(min_ngram, max_ngram):
+            if gram_as_tuple:
+                gram = tuple(term_seq[idx : idx + gram_level])
+            else:
+                gram = "".join(term_seq[idx : idx + gram_level])
+            if gram not in cur_grams:
+                if ignore_punct and any(PUNCTS_PAT.match(item) for item in gram):
+                    pass
+                else:
+                    cur_grams.append(gram)
+        terms.extend(cur_grams)
+    return terms
+
+
+def slow_cosine_sim(
+    s1, s2, term="word", ngram_range=None, ngram_weights=None, lower=True, ignore_punct=True
+):
+    """`cosine_sim` before it split texts once for all n-gram levels"""
+    if not ngram_range or ngram_range[1] == ngram_range[0] + 1:
+        first_term_freq = Counter(slow_make_terms(s1, term, ngram_range, lower, ignore_punct))
+        second_term_freq = Counter(slow_make_terms(s2, term, ngram_range, lower, ignore_punct))
+
+        first_norm = 0
+        second_norm = 0
+        inner_product = 0
+
+        for term, freq in first_term_freq.items():
+            first_norm += freq**2
+            inner_product += freq * second_term_freq[term]
+
+        for _, freq in second_term_freq.items():
+            second_norm += freq**2
+
+        if first_norm == 0 and second_norm == 0:
+            return 1.0
+        if first_norm == 0 or second_norm == 0:
+            return 0.0
+
+        return inner_product / sqrt(first_norm * second_norm)
+    else:
+        weights = ngram_weights or list(range(*ngram_range))
+        weights_sum = sum(weights)
+        weights = [weight / weights_sum for weight in weights]
+        scores = []
+        for ngram_level in range(*ngram_range):
+            score = slow_cosine_sim(
+                s1,
+                s2,
+                term=term,
+                ngram_range=(ngram_level, ngram_level + 1),
+                lower=lower,
+                ignore_punct=ignore_punct,
+            )
+            scores.append(score)
+
+        return sum([score * weight for score, weight in zip(scores, weights)])
+
+
+def make_titles(count):
+    random.seed(0)
+    words = ["Python", "3.13", "release", "notes:", "new", "JIT", "faster", "CPython", "GC"]
+    words += ["发布", "性能", "提升", "新版本", "（更新）", "，", "。"]
+    return [
+        " ".join(random.choice(words) for _ in range(random.randint(4, 12))) for _ in range(count)
+    ]
+
+
+def run(name, func, count):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print("{:<34}{:>10.3f}{:>14.0f}".format(name, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--titles", type=int, default=2000)
+    parser.add_argument("-p", "--pair-titles", type=int, default=200)
+    args = parser.parse_args()
+
+    titles = make_titles(args.titles)
+    query, docs = titles[0], titles[1:]
+    params = dict(term="char", ngram_range=(2, 4))
+    assert all(slow_make_terms(t, "char", (2, 4)) == make_terms(t, "char", (2, 4)) for t in titles)
+    assert all(
+        slow_cosine_sim(query, doc, **params) == cosine_sim(query, doc, **params) for doc in docs
+    )
+
+    print("{:<34}{:>10}{:>14}".format("case", "secs", "items/sec"))
+    run(
+        "make_terms (slow)",
+        lambda: [slow_make_terms(t, "char", (2, 4)) for t in titles],
+        len(titles),
+    )
+    run("make_terms", lambda: [make_terms(t, "char", (2, 4)) for t in titles], len(titles))
+    run("tokenize", lambda: [tokenize(t, "char", (2, 4)) for t in titles], len(titles))
+    run("cosine_sim (slow)", lambda: [slow_cosine_sim(query, d, **params) for d in docs], len(docs))
+    run("cosine_sim", lambda: [cosine_sim(query, d, **params) for d in docs], len(docs))
+    tokenized = [tokenize(doc, **params) for doc in docs]
+    query_tokens = tokenize(query, **params)
+    run(
+        "cosine_sim (pre-tokenized)",
+        lambda: [cosine_sim(query_tokens, d, **params) for d in tokenized],
+        len(docs),
+    )
+
+    char_terms = [make_terms(doc, "char", None) for doc in docs]
+    run(
+        "SequenceMatcher.ratio",
+        lambda: [
+            SequenceMatcher(a=make_terms(query, "char", None), b=d).ratio() for d in char_terms
+        ],
+        len(docs),
+    )
+    matcher = LCSMatcher(query)
+    run("LCSMatcher.scores", lambda: matcher.scores(char_terms), len(docs))
+    run("LCSMatcher.scores (min_score=0.8)", lambda: matcher.scores(char_terms, 0.8), len(docs))
+
+    pair_titles = titles[: args.pair_titles]
+    pairs = len(pair_titles) ** 2
+    run(
+        "cosine_sim (all pairs)",
+        lambda: [cosine_sim(t1, t2, **params) for t1 in pair_titles for t2 in pair_titles],
+        pairs,
+    )
+    try:
+        run("sim_matrix (all pairs)", lambda: sim_matrix(pair_titles, **params), pairs)
+    except ImportError as error:
+        print(error)
+
+
+if __name__ == "__main__":
+    main()
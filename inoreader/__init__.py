@@ -1,4 +1,5 @@
 # coding: utf-8
+from .async_client import AsyncInoreaderClient
 from .client import InoreaderClient
 
-__all__ = ["InoreaderClient"]
+__all__ = ["InoreaderClient", "AsyncInoreaderClient"]
@@ -5,6 +5,20 @@ from .utils import extract_text, normalize_whitespace
 
 
 class Article(object):
+    __slots__ = (
+        "id",
+        "title",
+        "categories",
+        "link",
+        "published",
+        "content",
+        "author",
+        "feed_id",
+        "feed_title",
+        "feed_link",
+        "_text",
+    )
+
     def __init__(
         self,
         id,
@@ -24,12 +38,23 @@ class Article(object):
         self.link = link
         self.published = published
         self.content = content.strip() if content else ""
-        self.text = extract_text(self.content)
+        self._text = None
         self.author = author
         self.feed_id = feed_id
         self.feed_title = feed_title.strip()
         self.feed_link = feed_link
 
+    @property
+    def text(self):
+        """plain text of `content`, extracted on first access"""
+        if self._text is None:
+            self._text = extract_text(self.content)
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+
     @classmethod
     def from_json(cls, data):
         article_data = {
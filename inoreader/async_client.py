@@ -0,0 +1,316 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import asyncio
+import logging
+from urllib.parse import urljoin
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency
+    aiohttp = None
+
+from .article import Article
+from .client import BaseInoreaderClient
+from .consts import BASE_URL
+from .exception import APIError, NotLoginError, RateLimitError
+from .ratelimit import READ_ZONE, WRITE_ZONE, RateLimiter
+from .subscription import Subscription
+from .writer import EditTagResult, chunked
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncInoreaderClient(BaseInoreaderClient):
+    """asyncio version of `InoreaderClient`, requires `aiohttp`
+
+    Usage::
+
+        async with AsyncInoreaderClient(...) as client:
+            async for article in client.fetch_unread(folder="inbox"):
+                print(article.title)
+    """
+
+    def __init__(
+        self,
+        app_id,
+        app_key,
+        access_token,
+        refresh_token,
+        expires_at,
+        config_manager=None,
+        max_connections=100,
+        edit_chunk_size=10,
+        edit_workers=4,
+        edit_retries=2,
+        metadata_ttl=300,
+        metadata_cache_file=None,
+        rate_limit_wait=60,
+        keep_alive=True,
+        timeout=(10, 60),
+    ):
+        if aiohttp is None:
+            raise ImportError(
+                "aiohttp is required by AsyncInoreaderClient, "
+                "install it with `pip install python-inoreader[async]`"
+            )
+
+        super(AsyncInoreaderClient, self).__init__(
+            app_id,
+            app_key,
+            access_token,
+            refresh_token,
+            expires_at,
+            config_manager,
+            metadata_ttl,
+            metadata_cache_file,
+        )
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.edit_chunk_size = edit_chunk_size
+        self.edit_workers = edit_workers
+        self.edit_retries = edit_retries
+        self.proxy = (self.proxies or {}).get("https") or (self.proxies or {}).get("http")
+        self._session = None
+        self.rate_limiter = RateLimiter(max_wait=rate_limit_wait)
+        self._token_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, force_close=not self.keep_alive
+            )
+            connect_timeout, read_timeout = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def check_token(self):
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+
+        async with self._token_lock:
+            # other coroutines may have refreshed the token while we were waiting
+            if self.token_expired():
+                await self.refresh_access_token()
+
+    @staticmethod
+    async def parse_response(response, json_data=True):
+        if response.status == 401:
+            raise NotLoginError
+        elif response.status != 200:
+            raise APIError(await response.text())
+
+        return await response.json(content_type=None) if json_data else await response.text()
+
+    @property
+    def rate_limits(self):
+        return self.rate_limiter.budget()
+
+    async def _request(self, method, url, params=None, json_data=True, zone=READ_ZONE):
+        await self.check_token()
+        for retried in (False, True):
+            wait = self.rate_limiter.wait_time(zone)
+            while wait:
+                LOGGER.info("rate limit of zone %d reached, wait %.1f seconds", zone, wait)
+                await asyncio.sleep(wait)
+                wait = self.rate_limiter.wait_time(zone)
+
+            released = False
+            try:
+                async with self.session.request(
+                    method, url, params=params, headers=self.auth_headers, proxy=self.proxy
+                ) as response:
+                    self.rate_limiter.release(zone, response.headers)
+                    released = True
+                    if response.status == 429 and not retried:
+                        self.rate_limiter.exhaust(zone, response.headers)
+                        continue
+
+                    return await self.parse_response(response, json_data=json_data)
+            finally:
+                if not released:
+                    self.rate_limiter.release(zone)
+
+    async def refresh_access_token(self):
+        url = urljoin(BASE_URL, self.TOKEN_PATH)
+        async with self.session.post(
+            url, json=self.refresh_payload(), proxy=self.proxy
+        ) as response:
+            self.update_token(await self.parse_response(response))
+
+    async def userinfo(self):
+        url = urljoin(BASE_URL, self.USER_INFO_PATH)
+        return await self._request("POST", url)
+
+    async def get_tag_list(self):
+        response = self.metadata_cache.get(self.TAG_LIST_CACHE_KEY)
+        if response is None:
+            url = urljoin(BASE_URL, self.TAG_LIST_PATH)
+            response = await self._request("POST", url, params={"types": 1, "counts": 1})
+            self.metadata_cache.set(self.TAG_LIST_CACHE_KEY, response)
+
+        return response
+
+    async def get_folders(self):
+        return self.parse_tag_list(await self.get_tag_list(), "folder")
+
+    async def get_tags(self):
+        return self.parse_tag_list(await self.get_tag_list(), "tag")
+
+    async def get_unread_counts(self):
+        return self.parse_unread_counts(await self.get_tag_list())
+
+    async def get_subscription_list(self):
+        subscriptions = self.metadata_cache.get(self.SUBSCRIPTION_LIST_CACHE_KEY)
+        if subscriptions is None:
+            url = urljoin(BASE_URL, self.SUBSCRIPTION_LIST_PATH)
+            subscriptions = (await self._request("GET", url))["subscriptions"]
+            self.metadata_cache.set(self.SUBSCRIPTION_LIST_CACHE_KEY, subscriptions)
+
+        for item in subscriptions:
+            yield Subscription.from_json(item)
+
+    async def _get_stream_contents(
+        self, stream_id=None, n=50, r=None, ot=None, xt=None, it=None, c=None
+    ):
+        """reference: https://www.inoreader.com/developers/stream-contents"""
+        url = self.stream_contents_url(stream_id)
+        params = {"n": n, "r": r, "ot": ot, "xt": xt, "it": it, "c": c}
+        params = {arg: val for arg, val in params.items() if val is not None}
+        response = await self._request("POST", url, params=params)
+        return response["items"], response.get("continuation")
+
+    async def fetch_articles(
+        self,
+        stream_id=None,
+        folder=None,
+        tags=None,
+        unread=True,
+        starred=False,
+        limit=None,
+        n=50,
+        ot=None,
+    ):
+        unread_counts = None
+        if not stream_id and tags and len(tags) > 1:
+            unread_counts = await self.get_unread_counts()
+
+        params = self.stream_params(stream_id, folder, tags, unread, starred, n, ot, unread_counts)
+        fetched_count = 0
+        while True:
+            items, continuation = await self._get_stream_contents(**params)
+            for data in items:
+                if not self.match_tags(data, tags):
+                    continue
+
+                yield Article.from_json(data)
+                fetched_count += 1
+                if limit and fetched_count >= limit:
+                    return
+
+            if not continuation:
+                return
+            params["c"] = continuation
+
+    async def fetch_unread(self, folder=None, tags=None, limit=None, n=50):
+        async for article in self.fetch_articles(
+            folder=folder, tags=tags, unread=True, limit=limit, n=n
+        ):
+            yield article
+
+    async def fetch_starred(self, folder=None, tags=None, limit=None, n=50):
+        async for article in self.fetch_articles(
+            folder=folder, tags=tags, unread=False, starred=True, limit=limit, n=n
+        ):
+            yield article
+
+    async def _post_edit_tag(self, ids, add=None, remove=None, retry_delay=1.0):
+        url = urljoin(BASE_URL, self.EDIT_TAG_PATH)
+        params = [(action, label) for action, label in (("a", add), ("r", remove)) if label]
+        params.extend(("i", item_id) for item_id in ids)
+        for attempt in range(self.edit_retries + 1):
+            try:
+                await self._request("POST", url, params=params, json_data=False, zone=WRITE_ZONE)
+                return None
+            except (NotLoginError, RateLimitError):
+                raise
+            except Exception as exception:
+                if attempt >= self.edit_retries:
+                    LOGGER.warning("failed to edit tags of %d articles: %r", len(ids), exception)
+                    return exception
+                await asyncio.sleep(retry_delay * 2**attempt)
+
+    async def edit_tag(self, ids, add=None, remove=None):
+        """Add and/or remove a label on articles by their ids, return an `EditTagResult`"""
+        semaphore = asyncio.Semaphore(max(1, self.edit_workers))
+
+        async def send(chunk):
+            async with semaphore:
+                return await self._post_edit_tag(chunk, add=add, remove=remove)
+
+        chunks = chunked(ids, self.edit_chunk_size)
+        errors = await asyncio.gather(*[send(chunk) for chunk in chunks])
+        result = EditTagResult()
+        for chunk, exception in zip(chunks, errors):
+            result.add_chunk(chunk, exception)
+
+        # unread counts may be changed
+        self.invalidate_cache(self.TAG_LIST_CACHE_KEY)
+        return result
+
+    async def add_general_label(self, articles, label):
+        return await self.edit_tag([article.id for article in articles], add=label)
+
+    async def remove_general_label(self, articles, label):
+        return await self.edit_tag([article.id for article in articles], remove=label)
+
+    async def add_tag(self, articles, tag):
+        return await self.add_general_label(articles, self.GENERAL_TAG_TEMPLATE.format(tag))
+
+    async def mark_as_read(self, articles):
+        return await self.add_general_label(articles, self.READ_TAG)
+
+    async def mark_as_starred(self, articles):
+        return await self.add_general_label(articles, self.STARRED_TAG)
+
+    async def mark_as_liked(self, articles):
+        return await self.add_general_label(articles, self.LIKED_TAG)
+
+    async def remove_tag(self, articles, tag):
+        return await self.remove_general_label(articles, self.GENERAL_TAG_TEMPLATE.format(tag))
+
+    async def remove_read(self, articles):
+        return await self.remove_general_label(articles, self.READ_TAG)
+
+    async def remove_starred(self, articles):
+        return await self.remove_general_label(articles, self.STARRED_TAG)
+
+    async def remove_liked(self, articles):
+        return await self.remove_general_label(articles, self.LIKED_TAG)
+
+    async def broadcast(self, articles):
+        return await self.add_general_label(articles, self.BROADCAST_TAG)
+
+    async def edit_subscription(
+        self, stream_id, action, title=None, add_folder=None, remove_folder=None
+    ):
+        url = urljoin(BASE_URL, self.EDIT_SUBSCRIPTION_PATH)
+        params = self.edit_subscription_params(stream_id, action, title, add_folder, remove_folder)
+        response = await self._request("POST", url, params=params, json_data=False, zone=WRITE_ZONE)
+        self.invalidate_cache(self.SUBSCRIPTION_LIST_CACHE_KEY, self.TAG_LIST_CACHE_KEY)
+        return response
@@ -0,0 +1,67 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import codecs
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MetadataCache(object):
+    """Key-value cache for API responses with TTL and optional JSON file backing
+
+    :param ttl: seconds before a cached value expires, 0 disables the cache
+    :param cache_file: JSON file to load cached values from and save them to
+    """
+
+    def __init__(self, ttl=300, cache_file=None):
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.data = {}
+        self.lock = Lock()
+        if cache_file and os.path.exists(cache_file):
+            self.load()
+
+    def load(self):
+        try:
+            with codecs.open(self.cache_file, encoding="utf-8") as f:
+                self.data = json.load(f)
+        except ValueError:
+            LOGGER.warning("ignore broken cache file: %s", self.cache_file)
+            self.data = {}
+
+    def save(self):
+        if not self.cache_file:
+            return
+
+        with codecs.open(self.cache_file, mode="w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+
+    def get(self, key):
+        with self.lock:
+            cached_at, value = self.data.get(key, (0, None))
+            if not self.ttl or time.time() - cached_at >= self.ttl:
+                return None
+
+            return value
+
+    def set(self, key, value):
+        if not self.ttl:
+            return
+
+        with self.lock:
+            self.data[key] = (time.time(), value)
+            self.save()
+
+    def invalidate(self, *keys):
+        """Remove cached values of `keys`, or all cached values if no key is given"""
+        with self.lock:
+            if not keys:
+                self.data.clear()
+            for key in keys:
+                self.data.pop(key, None)
+            self.save()
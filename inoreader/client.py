@@ -1,9 +1,15 @@
 # coding: utf-8
 from __future__ import print_function, unicode_literals
 
+import heapq
 import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 from operator import itemgetter
+from queue import Full, Queue
+from threading import Event, Lock
 from uuid import uuid4
 
 try:  # python2
@@ -14,78 +20,95 @@ except ImportError:  # python3
     from urllib.parse import urljoin, quote_plus
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .article import Article
+from .cache import MetadataCache
 from .consts import BASE_URL
 from .exception import APIError, NotLoginError
+from .plan import normalize_label
+from .ratelimit import READ_ZONE, WRITE_ZONE, RateLimiter
 from .subscription import Subscription
+from .utils import iter_json_items, read_ahead
+from .writer import EditTagWriter
 
 LOGGER = logging.getLogger(__name__)
 
 
-class InoreaderClient(object):
+class BaseInoreaderClient(object):
+    """Constants and I/O-free helpers shared by the sync and async clients"""
+
     # paths
     TOKEN_PATH = "/oauth2/token"
     USER_INFO_PATH = "user-info"
     TAG_LIST_PATH = "tag/list"
     SUBSCRIPTION_LIST_PATH = "subscription/list"
     STREAM_CONTENTS_PATH = "stream/contents/"
+    STREAM_ITEM_IDS_PATH = "stream/items/ids"
     EDIT_TAG_PATH = "edit-tag"
     EDIT_SUBSCRIPTION_PATH = "subscription/edit"
 
+    ITEM_ID_TEMPLATE = "tag:google.com,2005:reader/item/{:016x}"
+
     # tags
     GENERAL_TAG_TEMPLATE = "user/-/label/{}"
     READ_TAG = "user/-/state/com.google/read"
+    READING_LIST_TAG = "user/-/state/com.google/reading-list"
     STARRED_TAG = "user/-/state/com.google/starred"
     LIKED_TAG = "user/-/state/com.google/like"
     BROADCAST_TAG = "user/-/state/com.google/broadcast"
 
+    # keys of cached metadata
+    TAG_LIST_CACHE_KEY = "tag_list"
+    SUBSCRIPTION_LIST_CACHE_KEY = "subscription_list"
+
     def __init__(
-        self, app_id, app_key, access_token, refresh_token, expires_at, config_manager=None
+        self,
+        app_id,
+        app_key,
+        access_token,
+        refresh_token,
+        expires_at,
+        config_manager=None,
+        metadata_ttl=300,
+        metadata_cache_file=None,
     ):
         self.app_id = app_id
         self.app_key = app_key
         self.access_token = access_token
         self.refresh_token = refresh_token
         self.expires_at = float(expires_at)
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "AppId": self.app_id,
-                "AppKey": self.app_key,
-                "Authorization": "Bearer {}".format(self.access_token),
-            }
-        )
         self.config_manager = config_manager
         self.proxies = self.config_manager.proxies if config_manager else None
+        self.metadata_cache = MetadataCache(metadata_ttl, metadata_cache_file)
+
+    def invalidate_cache(self, *keys):
+        """Drop cached folders/tags/subscriptions, all of them if no key is given"""
+        self.metadata_cache.invalidate(*keys)
+
+    @property
+    def auth_headers(self):
+        return {
+            "AppId": self.app_id,
+            "AppKey": self.app_key,
+            "Authorization": "Bearer {}".format(self.access_token),
+        }
 
-    def check_token(self):
-        now = datetime.now().timestamp()
-        if now >= self.expires_at:
-            self.refresh_access_token()
-
-    @staticmethod
-    def parse_response(response, json_data=True):
-        if response.status_code == 401:
-            raise NotLoginError
-        elif response.status_code != 200:
-            raise APIError(response.text)
-
-        return response.json() if json_data else response.text
+    def token_expired(self):
+        return datetime.now().timestamp() >= self.expires_at
 
-    def refresh_access_token(self):
-        url = urljoin(BASE_URL, self.TOKEN_PATH)
-        payload = {
+    def refresh_payload(self):
+        return {
             "client_id": self.app_id,
             "client_secret": self.app_key,
             "grant_type": "refresh_token",
             "refresh_token": self.refresh_token,
         }
-        response = self.parse_response(requests.post(url, json=payload, proxies=self.proxies))
+
+    def update_token(self, response):
         self.access_token = response["access_token"]
         self.refresh_token = response["refresh_token"]
         self.expires_at = datetime.now().timestamp() + response["expires_in"]
-        self.session.headers["Authorization"] = "Bearer {}".format(self.access_token)
 
         if self.config_manager:
             self.config_manager.access_token = self.access_token
@@ -93,203 +116,629 @@ class InoreaderClient(object):
             self.config_manager.expires_at = self.expires_at
             self.config_manager.save()
 
-    def userinfo(self):
-        self.check_token()
+    @staticmethod
+    def parse_tag_list(response, tag_type):
+        results = []
+        for item in response["tags"]:
+            if item.get("type") != tag_type:
+                continue
 
-        url = urljoin(BASE_URL, self.USER_INFO_PATH)
-        return self.parse_response(self.session.post(url, proxies=self.proxies))
+            name = item["id"].split("/")[-1]
+            results.append({"name": name, "unread_count": item["unread_count"]})
 
-    def get_folders(self):
-        self.check_token()
+        results.sort(key=itemgetter("name"))
+        return results
 
-        url = urljoin(BASE_URL, self.TAG_LIST_PATH)
-        params = {"types": 1, "counts": 1}
-        response = self.parse_response(self.session.post(url, params=params, proxies=self.proxies))
+    @staticmethod
+    def parse_unread_counts(response):
+        return {item["id"]: item.get("unread_count", 0) for item in response["tags"]}
 
-        folders = []
-        for item in response["tags"]:
-            if item.get("type") != "folder":
-                continue
+    def stream_contents_url(self, stream_id=None):
+        url = urljoin(BASE_URL, self.STREAM_CONTENTS_PATH)
+        if stream_id:
+            url = urljoin(url, quote_plus(stream_id))
 
-            folder_name = item["id"].split("/")[-1]
-            folders.append({"name": folder_name, "unread_count": item["unread_count"]})
+        return url
 
-        folders.sort(key=itemgetter("name"))
-        return folders
+    def resolve_stream_id(self, stream_id=None, folder=None, tags=None):
+        if not stream_id:
+            if folder:
+                stream_id = self.GENERAL_TAG_TEMPLATE.format(folder)
+            elif tags:
+                stream_id = self.GENERAL_TAG_TEMPLATE.format(tags[0])
 
-    def get_tags(self):
-        self.check_token()
+        return stream_id
 
-        url = urljoin(BASE_URL, self.TAG_LIST_PATH)
-        params = {"types": 1, "counts": 1}
-        response = self.parse_response(self.session.post(url, params=params, proxies=self.proxies))
+    def plan_tag_stream(self, folder=None, tags=None, starred=False, unread_counts=None):
+        """Choose how to fetch the articles having all `tags`, return `(stream id, it param)`
 
-        tags = []
-        for item in response["tags"]:
-            if item.get("type") != "tag":
+        The tag with the fewest unread articles drives the stream unless a folder is given, the
+        next most selective tag is sent as the `it` param if it is not used for starred articles,
+        the other tags are left to `match_tags`. Tags keep their order without `unread_counts`.
+        """
+        counts = {normalize_label(key): count for key, count in (unread_counts or {}).items()}
+        labels = sorted(
+            (self.GENERAL_TAG_TEMPLATE.format(tag) for tag in tags),
+            key=lambda label: counts.get(label, float("inf")),
+        )
+        stream_id = self.GENERAL_TAG_TEMPLATE.format(folder) if folder else labels.pop(0)
+        include_target = labels[0] if labels and not starred else None
+        LOGGER.debug("fetch tags %s with stream %s and it=%s", tags, stream_id, include_target)
+        return stream_id, include_target
+
+    def stream_params(
+        self,
+        stream_id=None,
+        folder=None,
+        tags=None,
+        unread=True,
+        starred=False,
+        n=50,
+        ot=None,
+        unread_counts=None,
+    ):
+        include_target = None
+        if not stream_id and tags:
+            stream_id, include_target = self.plan_tag_stream(folder, tags, starred, unread_counts)
+        else:
+            stream_id = self.resolve_stream_id(stream_id, folder, tags)
+
+        params = {"stream_id": stream_id, "n": n, "c": str(uuid4())}
+        if ot:
+            params["ot"] = ot
+
+        if unread:
+            params["xt"] = self.READ_TAG
+
+        if starred:
+            params["it"] = self.STARRED_TAG
+        elif include_target:
+            params["it"] = include_target
+
+        return params
+
+    @staticmethod
+    def match_tags(data, tags):
+        if not tags:
+            return True
+
+        categories = {
+            category.split("/")[-1]
+            for category in data.get("categories", [])
+            if category.find("label") > 0
+        }
+        return categories.issuperset(set(tags))
+
+    def edit_subscription_params(
+        self, stream_id, action, title=None, add_folder=None, remove_folder=None
+    ):
+        # https://us.inoreader.com/developers/edit-subscription
+        # The documentation looks a bit outdated, `follow`/`unfollow` don't work
+        action = {"follow": "subscribe", "unfollow": "unsubscribe"}.get(action) or action
+        params = {"ac": action, "s": stream_id}
+        if title:
+            params["t"] = title
+
+        if add_folder:
+            params["a"] = add_folder
+
+        if remove_folder:
+            params["r"] = remove_folder
+
+        return params
+
+
+class InoreaderClient(BaseInoreaderClient):
+    def __init__(
+        self,
+        app_id,
+        app_key,
+        access_token,
+        refresh_token,
+        expires_at,
+        config_manager=None,
+        edit_chunk_size=10,
+        edit_workers=4,
+        edit_retries=2,
+        metadata_ttl=300,
+        metadata_cache_file=None,
+        rate_limit_wait=60,
+        pool_size=10,
+        keep_alive=True,
+        timeout=(10, 60),
+        max_retries=3,
+        backoff_factor=0.5,
+        hedge_after=None,
+    ):
+        """
+        :param edit_chunk_size: maximum number of article ids per `edit-tag` request
+        :param edit_workers: maximum number of `edit-tag` requests in flight
+        :param edit_retries: times to retry a failed `edit-tag` request
+        :param metadata_ttl: seconds to cache folders/tags/subscriptions, 0 disables the cache
+        :param metadata_cache_file: JSON file to keep cached folders/tags/subscriptions across runs
+        :param rate_limit_wait: maximum seconds to wait for the reset of rate limits, raise
+                                `RateLimitError` instead if the reset is later
+        :param pool_size: maximum number of pooled connections
+        :param keep_alive: reuse connections between requests
+        :param timeout: `(connect timeout, read timeout)` of requests in seconds
+        :param max_retries: times to retry a request on connection errors, timeouts and 5xx,
+                            except `edit-tag` requests which are retried `edit_retries` times
+        :param backoff_factor: retry after `backoff_factor * 2 ** n` seconds with random jitter
+        :param hedge_after: if a read request takes more than this many seconds, send a duplicate
+                            one and use whichever responds first, `None` disables hedging
+        """
+        super(InoreaderClient, self).__init__(
+            app_id,
+            app_key,
+            access_token,
+            refresh_token,
+            expires_at,
+            config_manager,
+            metadata_ttl,
+            metadata_cache_file,
+        )
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.hedge_after = hedge_after
+        self._token_lock = Lock()
+        self.session = requests.Session()
+        self.session.headers.update(self.auth_headers)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._hedge_executor = (
+            ThreadPoolExecutor(max_workers=pool_size) if hedge_after is not None else None
+        )
+        self.rate_limiter = RateLimiter(max_wait=rate_limit_wait)
+        self.tag_writer = EditTagWriter(
+            self._post_edit_tag,
+            chunk_size=edit_chunk_size,
+            max_workers=edit_workers,
+            retries=edit_retries,
+        )
+
+    def check_token(self):
+        with self._token_lock:
+            # other threads may have refreshed the token while we were waiting, the refresh
+            # token changes on each refresh so it can't be used twice
+            if self.token_expired():
+                self.refresh_access_token()
+
+    @staticmethod
+    def parse_response(response, json_data=True):
+        if response.status_code == 401:
+            raise NotLoginError
+        elif response.status_code != 200:
+            raise APIError(response.text)
+
+        return response.json() if json_data else response.text
+
+    @property
+    def rate_limits(self):
+        """Limit, usage, remaining requests and reset time of each rate limit zone"""
+        return self.rate_limiter.budget()
+
+    def _send(self, method, url, zone, **kwargs):
+        self.rate_limiter.acquire(zone)
+        return self._send_request(method, url, zone, **kwargs)
+
+    def _send_request(self, method, url, zone, **kwargs):
+        """Send a request reserved in the rate limit zone, and release it"""
+        response = None
+        try:
+            response = self.session.request(
+                method, url, proxies=self.proxies, timeout=self.timeout, **kwargs
+            )
+            return response
+        finally:
+            self.rate_limiter.release(zone, response.headers if response is not None else None)
+
+    def _send_hedged(self, method, url, zone, **kwargs):
+        if self._hedge_executor is None:
+            return self._send(method, url, zone, **kwargs)
+
+        # wait for the budget before the timer, only a slow response is hedged
+        self.rate_limiter.acquire(zone)
+        primary = self._hedge_executor.submit(self._send_request, method, url, zone, **kwargs)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done or not self.rate_limiter.try_acquire(zone):
+            # no budget left for a duplicate request
+            return primary.result()
+
+        LOGGER.debug("no response in %.1f seconds, send hedged request: %s", self.hedge_after, url)
+        hedged = self._hedge_executor.submit(self._send_request, method, url, zone, **kwargs)
+        error = None
+        for future in as_completed([primary, hedged]):
+            try:
+                response = future.result()
+            except Exception as exception:
+                error = exception
                 continue
 
-            folder_name = item["id"].split("/")[-1]
-            tags.append({"name": folder_name, "unread_count": item["unread_count"]})
+            # release the connection of the other request, its streamed body is never read
+            other = hedged if future is primary else primary
+            other.add_done_callback(self._close_response)
+            return response
+        raise error
+
+    @staticmethod
+    def _close_response(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def _request(
+        self,
+        method,
+        url,
+        zone=READ_ZONE,
+        json_data=True,
+        hedge=False,
+        stream=False,
+        max_retries=None,
+        **kwargs,
+    ):
+        """Send a request with rate limiting, retry and optional hedging
+
+        :param hedge: the request is an idempotent read and can be hedged
+        :param stream: return the response without reading its body
+        :param max_retries: override `max_retries` of the client, for callers which retry
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        self.check_token()
+        send = self._send_hedged if hedge else self._send
+        attempt, rate_limited = 0, False
+        while True:
+            try:
+                response = send(method, url, zone, stream=stream, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                error = exception
+            else:
+                if response.status_code == 429 and not rate_limited:
+                    rate_limited = True
+                    self.rate_limiter.exhaust(zone, response.headers)
+                    # the body of a streamed response holds the pooled connection until closed
+                    response.close()
+                    continue
+
+                if stream and response.status_code == 200:
+                    return response
+                if response.status_code < 500:
+                    return self.parse_response(response, json_data)
+                error = APIError(response.text)
+
+            if attempt >= max_retries:
+                raise error
+
+            delay = self.backoff_factor * 2**attempt * random.uniform(0.5, 1.5)
+            LOGGER.debug("retry %s in %.1f seconds: %r", url, delay, error)
+            time.sleep(delay)
+            attempt += 1
+
+    def refresh_access_token(self):
+        url = urljoin(BASE_URL, self.TOKEN_PATH)
+        payload = self.refresh_payload()
+        response = self.parse_response(
+            self.session.post(
+                url,
+                json=payload,
+                # the expired token is useless for refreshing
+                headers={"Authorization": None},
+                proxies=self.proxies,
+                timeout=self.timeout,
+            )
+        )
+        self.update_token(response)
+        self.session.headers["Authorization"] = "Bearer {}".format(self.access_token)
+
+    def userinfo(self):
+        url = urljoin(BASE_URL, self.USER_INFO_PATH)
+        return self._request("POST", url)
+
+    def get_tag_list(self):
+        """Raw response of `tag/list` with unread counts, cached"""
+        response = self.metadata_cache.get(self.TAG_LIST_CACHE_KEY)
+        if response is None:
+            url = urljoin(BASE_URL, self.TAG_LIST_PATH)
+            response = self._request("POST", url, hedge=True, params={"types": 1, "counts": 1})
+            self.metadata_cache.set(self.TAG_LIST_CACHE_KEY, response)
+
+        return response
+
+    def get_folders(self):
+        return self.parse_tag_list(self.get_tag_list(), "folder")
 
-        tags.sort(key=itemgetter("name"))
-        return tags
+    def get_tags(self):
+        return self.parse_tag_list(self.get_tag_list(), "tag")
+
+    def get_unread_counts(self):
+        """Return {stream id: unread count} of folders, tags and states"""
+        return self.parse_unread_counts(self.get_tag_list())
 
     def get_subscription_list(self):
-        self.check_token()
+        subscriptions = self.metadata_cache.get(self.SUBSCRIPTION_LIST_CACHE_KEY)
+        if subscriptions is None:
+            url = urljoin(BASE_URL, self.SUBSCRIPTION_LIST_PATH)
+            subscriptions = self._request("GET", url, hedge=True)["subscriptions"]
+            self.metadata_cache.set(self.SUBSCRIPTION_LIST_CACHE_KEY, subscriptions)
 
-        url = urljoin(BASE_URL, self.SUBSCRIPTION_LIST_PATH)
-        response = self.parse_response(self.session.get(url, proxies=self.proxies))
-        for item in response["subscriptions"]:
+        for item in subscriptions:
             yield Subscription.from_json(item)
 
     def __get_stream_contents(
-        self, stream_id=None, n=50, r=None, ot=None, xt=None, it=None, c=None
+        self, stream_id=None, n=50, r=None, ot=None, xt=None, it=None, c=None, meta=None
     ):
-        """reference: https://www.inoreader.com/developers/stream-contents"""
-        self.check_token()
-
-        url = urljoin(BASE_URL, self.STREAM_CONTENTS_PATH)
-        if stream_id:
-            url = urljoin(url, quote_plus(stream_id))
+        """reference: https://www.inoreader.com/developers/stream-contents
 
+        If `meta` is a dict, items are decoded one by one while the response is being read,
+        and the continuation is saved in `meta` after all items are consumed.
+        """
+        url = self.stream_contents_url(stream_id)
         params = {"n": n, "r": r, "ot": ot, "xt": xt, "it": it, "c": c}
         params = {arg: val for arg, val in params.items() if val is not None}
-        response = self.parse_response(self.session.post(url, params=params, proxies=self.proxies))
+        if meta is not None:
+            response = self._request("POST", url, hedge=True, stream=True, params=params)
+            return self.__iter_response_items(response, meta), None
+
+        response = self._request("POST", url, hedge=True, params=params)
         if "continuation" in response:
             return response["items"], response["continuation"]
         else:
             return response["items"], None
 
+    @staticmethod
+    def __iter_response_items(response, meta):
+        try:
+            for item in iter_json_items(response.iter_content(chunk_size=65536), "items", meta):
+                yield item
+        finally:
+            response.close()
+
+    def _iter_stream_pages(self, params, streaming=False):
+        while True:
+            meta = {} if streaming else None
+            items, continuation = self.__get_stream_contents(meta=meta, **params)
+            try:
+                yield items
+            finally:
+                if streaming:
+                    # release the connection if items are not all consumed
+                    items.close()
+            if streaming:
+                # available now since all items of the page are consumed
+                continuation = meta.get("continuation")
+            if not continuation:
+                break
+            params["c"] = continuation
+
     def fetch_articles(
-        self, stream_id=None, folder=None, tags=None, unread=True, starred=False, limit=None, n=50
+        self,
+        stream_id=None,
+        folder=None,
+        tags=None,
+        unread=True,
+        starred=False,
+        limit=None,
+        n=50,
+        prefetch=0,
+        ot=None,
+        streaming=False,
     ):
-        self.check_token()
+        """Fetch articles of a stream
+
+        :param tags: only fetch articles having all these tags, the tag with the fewest unread
+                     articles is used as the stream if no `stream_id`/`folder` is given
+        :param ot: only fetch articles newer than this unix timestamp
+        :param prefetch: number of continuation pages to fetch in background while the current
+                         page is consumed, 0 means fetching the next page only when needed
+        :param streaming: decode articles one by one while reading the response instead of
+                          loading the whole page in memory, can't be used with `prefetch`
+        """
+        if streaming and prefetch > 0:
+            raise ValueError("`streaming` can't be used with `prefetch`")
 
-        if not stream_id:
-            if folder:
-                stream_id = self.GENERAL_TAG_TEMPLATE.format(folder)
-            elif tags:
-                stream_id = self.GENERAL_TAG_TEMPLATE.format(tags[0])
+        self.check_token()
 
-        params = {"stream_id": stream_id, "n": n, "c": str(uuid4())}
-        if unread:
-            params["xt"] = self.READ_TAG
+        unread_counts = None
+        if not stream_id and tags and len(tags) > 1:
+            unread_counts = self.get_unread_counts()
 
-        if starred:
-            params["it"] = self.STARRED_TAG
+        params = self.stream_params(stream_id, folder, tags, unread, starred, n, ot, unread_counts)
+        pages = self._iter_stream_pages(params, streaming)
+        if prefetch > 0:
+            pages = read_ahead(pages, prefetch)
 
         fetched_count = 0
-        items, continuation = self.__get_stream_contents(**params)
-        for data in items:
-            categories = {
-                category.split("/")[-1]
-                for category in data.get("categories", [])
-                if category.find("label") > 0
-            }
-            if tags and not categories.issuperset(set(tags)):
-                continue
+        try:
+            for items in pages:
+                for data in items:
+                    if not self.match_tags(data, tags):
+                        continue
+
+                    yield Article.from_json(data)
+                    fetched_count += 1
+                    if limit and fetched_count >= limit:
+                        return
+        finally:
+            pages.close()
+
+    def fetch_item_ids(self, stream_id=None, unread=True, n=1000, starred=False):
+        """Fetch ids of articles in a stream without their contents
+
+        reference: https://www.inoreader.com/developers/item-ids
+        """
+        url = urljoin(BASE_URL, self.STREAM_ITEM_IDS_PATH)
+        params = {
+            "s": stream_id,
+            "n": n,
+            "xt": self.READ_TAG if unread else None,
+            "it": self.STARRED_TAG if starred else None,
+        }
+        params = {arg: val for arg, val in params.items() if val is not None}
+        while True:
+            response = self._request("POST", url, hedge=True, params=params)
+            for item in response.get("itemRefs") or []:
+                # itemRefs use the short decimal form of ids
+                yield self.ITEM_ID_TEMPLATE.format(int(item["id"]))
 
-            yield Article.from_json(data)
-            fetched_count += 1
-            if limit and fetched_count >= limit:
+            if not response.get("continuation"):
                 break
-
-        while continuation and (not limit or fetched_count < limit):
-            params["c"] = continuation
-            items, continuation = self.__get_stream_contents(**params)
-            for data in items:
-                categories = {
-                    category.split("/")[-1]
-                    for category in data.get("categories", [])
-                    if category.find("label") > 0
-                }
-                if tags and not categories.issuperset(set(tags)):
+            params["c"] = response["continuation"]
+
+    def fetch_many(self, streams, max_workers=4, order="completion", with_stream=False, **kwargs):
+        """Fetch articles of several streams concurrently and merge them into one iterator
+
+        :param streams: stream ids, or dicts of arguments for `fetch_articles`
+        :param max_workers: maximum number of streams fetched at the same time
+        :param order: "completion" yields articles as soon as they are fetched, at most a page
+                      of every running stream is buffered; "published" merges all streams by
+                      published time, newest first, which fetches every stream in full and
+                      keeps all their articles in memory before yielding the first one
+        :param with_stream: yield `(index of stream, article)` instead of `article`
+        :param kwargs: default arguments for `fetch_articles`, overridden by stream dicts
+        """
+        if order not in ("completion", "published"):
+            raise ValueError("unsupported order: {}".format(order))
+
+        specs = []
+        for stream in streams:
+            spec = dict(kwargs)
+            spec.update(stream if isinstance(stream, dict) else {"stream_id": stream})
+            specs.append(spec)
+
+        if not specs:
+            return
+
+        # refresh an expired token before starting the workers, instead of making them wait
+        self.check_token()
+        workers = max(1, min(max_workers, len(specs)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            if order == "published":
+                # every stream is sorted by published time (newest first) already, but the
+                # merge needs the head of all of them while only `workers` streams can run
+                results = executor.map(
+                    lambda item: [(item[0], article) for article in self.fetch_articles(**item[1])],
+                    enumerate(specs),
+                )
+                items = heapq.merge(*results, key=lambda item: item[1].published, reverse=True)
+            else:
+                # a page of every running stream, 50 is the page size of the server for `n=None`
+                depth = workers * max(spec.get("n") or 50 for spec in specs)
+                items = self._fetch_in_completion_order(executor, specs, depth)
+
+            for index, article in items:
+                yield (index, article) if with_stream else article
+        finally:
+            executor.shutdown(wait=False)
+
+    def _fetch_in_completion_order(self, executor, specs, depth):
+        queue, stopped, done = Queue(maxsize=depth), Event(), object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
                     continue
-                yield Article.from_json(data)
-                fetched_count += 1
-                if limit and fetched_count >= limit:
-                    break
-
-    def fetch_unread(self, folder=None, tags=None, limit=None, n=None):
-        for article in self.fetch_articles(folder=folder, tags=tags, unread=True, n=n):
+            return False
+
+        def worker(index, spec):
+            try:
+                if stopped.is_set():
+                    return
+                for article in self.fetch_articles(**spec):
+                    if not put((index, article)):
+                        break
+            except Exception as exception:
+                put(exception)
+            finally:
+                put(done)
+
+        for index, spec in enumerate(specs):
+            executor.submit(worker, index, spec)
+
+        try:
+            running = len(specs)
+            while running:
+                item = queue.get()
+                if item is done:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopped.set()
+
+    def fetch_unread(self, folder=None, tags=None, limit=None, n=None, prefetch=0):
+        for article in self.fetch_articles(
+            folder=folder, tags=tags, unread=True, n=n, prefetch=prefetch
+        ):
             yield article
 
-    def fetch_starred(self, folder=None, tags=None, limit=None, n=None):
+    def fetch_starred(self, folder=None, tags=None, limit=None, n=None, prefetch=0):
         for article in self.fetch_articles(
-            folder=folder, tags=tags, unread=False, starred=True, n=n
+            folder=folder, tags=tags, unread=False, starred=True, n=n, prefetch=prefetch
         ):
             yield article
 
-    def add_general_label(self, articles, label):
-        self.check_token()
-
+    def _post_edit_tag(self, ids, add=None, remove=None):
         url = urljoin(BASE_URL, self.EDIT_TAG_PATH)
-        for start in range(0, len(articles), 10):
-            end = min(start + 10, len(articles))
-            params = {"a": label, "i": [articles[idx].id for idx in range(start, end)]}
-            self.parse_response(
-                self.session.post(url, params=params, proxies=self.proxies), json_data=False
-            )
+        params = {"a": add, "r": remove, "i": list(ids)}
+        params = {arg: val for arg, val in params.items() if val is not None}
+        # chunks are retried by `tag_writer`
+        self._request("POST", url, zone=WRITE_ZONE, json_data=False, max_retries=0, params=params)
 
-    def remove_general_label(self, articles, label):
+    def edit_tag(self, ids, add=None, remove=None):
+        """Add and/or remove a label on articles by their ids, return an `EditTagResult`"""
         self.check_token()
+        result = self.tag_writer.edit(ids, add=add, remove=remove)
+        # unread counts may be changed
+        self.invalidate_cache(self.TAG_LIST_CACHE_KEY)
+        return result
 
-        url = urljoin(BASE_URL, self.EDIT_TAG_PATH)
-        for start in range(0, len(articles), 10):
-            end = min(start + 10, len(articles))
-            params = {"r": label, "i": [articles[idx].id for idx in range(start, end)]}
-            self.parse_response(
-                self.session.post(url, params=params, proxies=self.proxies), json_data=False
-            )
+    def add_general_label(self, articles, label):
+        return self.edit_tag([article.id for article in articles], add=label)
+
+    def remove_general_label(self, articles, label):
+        return self.edit_tag([article.id for article in articles], remove=label)
 
     def add_tag(self, articles, tag):
-        self.add_general_label(articles, self.GENERAL_TAG_TEMPLATE.format(tag))
+        return self.add_general_label(articles, self.GENERAL_TAG_TEMPLATE.format(tag))
 
     def mark_as_read(self, articles):
-        self.add_general_label(articles, self.READ_TAG)
+        return self.add_general_label(articles, self.READ_TAG)
 
     def mark_as_starred(self, articles):
-        self.add_general_label(articles, self.STARRED_TAG)
+        return self.add_general_label(articles, self.STARRED_TAG)
 
     def mark_as_liked(self, articles):
-        self.add_general_label(articles, self.LIKED_TAG)
+        return self.add_general_label(articles, self.LIKED_TAG)
 
     def remove_tag(self, articles, tag):
-        self.remove_general_label(articles, self.GENERAL_TAG_TEMPLATE.format(tag))
+        return self.remove_general_label(articles, self.GENERAL_TAG_TEMPLATE.format(tag))
 
     def remove_read(self, articles):
-        self.remove_general_label(articles, self.READ_TAG)
+        return self.remove_general_label(articles, self.READ_TAG)
 
     def remove_starred(self, articles):
-        self.remove_general_label(articles, self.STARRED_TAG)
+        return self.remove_general_label(articles, self.STARRED_TAG)
 
     def remove_liked(self, articles):
-        self.remove_general_label(articles, self.LIKED_TAG)
+        return self.remove_general_label(articles, self.LIKED_TAG)
 
     def broadcast(self, articles):
-        self.add_general_label(articles, self.BROADCAST_TAG)
+        return self.add_general_label(articles, self.BROADCAST_TAG)
 
     def edit_subscription(self, stream_id, action, title=None, add_folder=None, remove_folder=None):
-        self.check_token()
         url = urljoin(BASE_URL, self.EDIT_SUBSCRIPTION_PATH)
-        # https://us.inoreader.com/developers/edit-subscription
-        # The documentation looks a bit outdated, `follow`/`unfollow` don't work
-        action = {"follow": "subscribe", "unfollow": "unsubscribe"}.get(action) or action
-        params = {"ac": action, "s": stream_id}
-        if title:
-            params["t"] = title
-
-        if add_folder:
-            params["a"] = add_folder
-
-        if remove_folder:
-            params["r"] = remove_folder
-
-        r = self.session.post(url, params=params, proxies=self.proxies)
-        response = self.parse_response(
-            r,
-            # self.session.post(url, params=params, proxies=self.proxies),
-            json_data=False,
-        )
+        params = self.edit_subscription_params(stream_id, action, title, add_folder, remove_folder)
+        response = self._request("POST", url, zone=WRITE_ZONE, json_data=False, params=params)
+        self.invalidate_cache(self.SUBSCRIPTION_LIST_CACHE_KEY, self.TAG_LIST_CACHE_KEY)
         return response
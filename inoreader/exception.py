@@ -6,3 +6,8 @@ class NotLoginError(ValueError):
 class APIError(ValueError):
     def __repr__(self):
         return "<APIError>"
+
+
+class RateLimitError(APIError):
+    def __repr__(self):
+        return "<RateLimitError>"
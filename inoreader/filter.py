@@ -1,4 +1,12 @@
 import re
+from functools import lru_cache
+
+try:  # python3.11+
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
 
 _FILTERS = {}
 
@@ -14,43 +22,238 @@ def register_filter(name, override=False):
     return wrap
 
 
-@register_filter("include_any")
-class IncludeAnyFilter(object):
-    def __init__(self, rules):
-        self.rules = [re.compile(regexp, re.IGNORECASE) for regexp in rules]
+def iter_subpatterns(value):
+    """Yield parsed subpatterns nested in the argument of a regex opcode"""
+    if isinstance(value, sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            for subpattern in iter_subpatterns(item):
+                yield subpattern
+
+
+def has_backref(parsed):
+    for op, av in parsed:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return True
+        if any(has_backref(subpattern) for subpattern in iter_subpatterns(av)):
+            return True
+
+    return False
 
-    def validate(self, text):
-        for regexp in self.rules:
-            if regexp.findall(text):
-                return True
 
+def can_merge(pattern, flags):
+    """Whether the pattern keeps its meaning as one branch of a bigger alternation"""
+    try:
+        re.compile("(?:)|(" + pattern + ")", flags)
+    except re.error:
+        # global inline flags are only allowed at the start of a regex
         return False
 
+    # names of groups may clash with those of other patterns
+    return not re.compile(pattern, flags).groupindex and not has_backref(
+        sre_parse.parse(pattern, flags)
+    )
 
-@register_filter("include_all")
-class IncludeAllFilter(object):
-    def __init__(self, rules):
-        self.rules = [re.compile(regexp, re.IGNORECASE) for regexp in rules]
 
-    def validate(self, text):
-        for regexp in self.rules:
-            if not regexp.findall(text):
+@lru_cache(maxsize=16)
+def fold_case(text):
+    """Case-fold the text for substring checks of literals of case-insensitive regexes"""
+    # `re` matches dotted capital I and dotless i with i, which `casefold` doesn't: it folds
+    # the former to i and a combining dot, and keeps the latter
+    return text.replace("\u0130", "i").casefold().replace("\u0131", "i")
+
+
+def required_literals(parsed):
+    """Return literals one of which is in any text matched by the parsed regex, or None
+
+    Literals are case-folded, the one with the longest shortest literal is chosen among the
+    literal runs and the required groups, branches and repeats of the regex.
+    """
+    candidates, run = [], []
+    for op, av in list(parsed) + [(None, None)]:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if run:
+            candidates.append({fold_case("".join(run))})
+            run = []
+
+        literals = None
+        if op is sre_constants.SUBPATTERN:
+            literals = required_literals(av[-1])
+        elif op is sre_constants.BRANCH:
+            branches = [required_literals(branch) for branch in av[1]]
+            if all(branches):
+                literals = set().union(*branches)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            literals = required_literals(av[2])
+
+        if literals:
+            candidates.append(literals)
+
+    if not candidates:
+        return None
+
+    return max(candidates, key=lambda literals: min(len(literal) for literal in literals))
+
+
+class PatternMatcher(object):
+    """Search a list of regexes in a text in one pass and report which of them hit
+
+    Before any regex runs, the text is checked for the literals required by each pattern (see
+    `required_literals`) with plain substring search. The patterns whose literals are in the
+    text are merged into an alternation of capturing groups, compiled once per set of such
+    patterns, and the last group closed by a match (`lastindex`) tells which pattern hits.
+    Patterns which can't be merged without changing their meaning, such as those with
+    backreferences or named groups, are searched one by one.
+
+    :param patterns: regexes, their indexes in the list are used as pattern ids
+    :param flags: flags of all regexes
+    :param prefilter: check the required literals of patterns before searching them
+    """
+
+    # maximum number of alternations kept for the sets of patterns left by the prefilter
+    MAX_COMBINED = 256
+
+    def __init__(self, patterns, flags=re.IGNORECASE, prefilter=True):
+        self.patterns = list(patterns)
+        self.flags = flags
+        self.regexps = [re.compile(pattern, flags) for pattern in self.patterns]
+        # required literals of each pattern, None if a pattern has no literal or no prefilter
+        self.literals = [
+            required_literals(sre_parse.parse(pattern, flags)) if prefilter else None
+            for pattern in self.patterns
+        ]
+        self.mergeable = [can_merge(pattern, flags) for pattern in self.patterns]
+        # ids of merged patterns -> (alternation, group index -> pattern id)
+        self._combined = {}
+
+    def candidates(self, text):
+        """Yield ids of patterns whose required literals are in the text"""
+        folded = None
+        for pattern_id, literals in enumerate(self.literals):
+            if literals is None:
+                yield pattern_id
+                continue
+
+            if folded is None:
+                folded = fold_case(text)
+            if any(literal in folded for literal in literals):
+                yield pattern_id
+
+    def combine(self, pattern_ids):
+        """Return the alternation of the patterns and the pattern id of each of its groups"""
+        pattern_ids = tuple(pattern_ids)
+        if len(pattern_ids) == 1:
+            # a regex on its own keeps the fast scan for its literal prefix
+            regexp = self.regexps[pattern_ids[0]]
+            return regexp, {index: pattern_ids[0] for index in range(regexp.groups + 1)}
+
+        combined = self._combined.get(pattern_ids)
+        if combined is None:
+            branches, group_ids, group_index = [], {}, 1
+            for pattern_id in pattern_ids:
+                branches.append("(" + self.patterns[pattern_id] + ")")
+                group_ids[group_index] = pattern_id
+                group_index += self.regexps[pattern_id].groups + 1
+
+            if len(self._combined) >= self.MAX_COMBINED:
+                self._combined.clear()
+            combined = self._combined[pattern_ids] = (
+                re.compile("|".join(branches), self.flags),
+                group_ids,
+            )
+
+        return combined
+
+    def _split(self, text):
+        """Ids of candidate patterns which are merged and which are searched on their own"""
+        merged, separate = [], []
+        for pattern_id in self.candidates(text):
+            (merged if self.mergeable[pattern_id] else separate).append(pattern_id)
+
+        return merged, separate
+
+    def _unmatched(self, text, merged):
+        """Ids of merged patterns which have no match in one scan of their alternation"""
+        unmatched = set(merged)
+        if merged:
+            combined, group_ids = self.combine(merged)
+            for match in combined.finditer(text):
+                unmatched.discard(group_ids[match.lastindex or 0])
+                if not unmatched:
+                    break
+
+        return unmatched
+
+    def search(self, text):
+        """Return the id of a pattern found in the text, or None, stop at the first match"""
+        merged, separate = self._split(text)
+        if merged:
+            combined, group_ids = self.combine(merged)
+            match = combined.search(text)
+            if match:
+                return group_ids[match.lastindex or 0]
+
+        for pattern_id in separate:
+            if self.regexps[pattern_id].search(text):
+                return pattern_id
+
+        return None
+
+    def search_all(self, text):
+        """Return ids of all patterns found in the text"""
+        merged, separate = self._split(text)
+        # a pattern may be hidden by an overlapping match of another pattern in the scan
+        unmatched = self._unmatched(text, merged)
+        return [
+            pattern_id
+            for pattern_id in sorted(merged + separate)
+            if not (pattern_id in unmatched or pattern_id in separate)
+            or self.regexps[pattern_id].search(text)
+        ]
+
+    def match_all(self, text):
+        """Whether all patterns are found in the text"""
+        merged, separate = self._split(text)
+        if len(merged) + len(separate) < len(self.patterns):
+            return False
+
+        for pattern_id in sorted(self._unmatched(text, merged)) + separate:
+            if not self.regexps[pattern_id].search(text):
                 return False
 
         return True
 
 
-@register_filter("exclude")
-class ExcludeFilter(object):
+class RegexFilter(object):
     def __init__(self, rules):
-        self.rules = [re.compile(regexp, re.IGNORECASE) for regexp in rules]
+        self.matcher = PatternMatcher(rules)
+        self.rules = self.matcher.regexps
+
+    def matched_patterns(self, text):
+        """Return the patterns found in the text"""
+        return [self.matcher.patterns[pattern_id] for pattern_id in self.matcher.search_all(text)]
 
+
+@register_filter("include_any")
+class IncludeAnyFilter(RegexFilter):
     def validate(self, text):
-        for regexp in self.rules:
-            if regexp.findall(text):
-                return False
+        return self.matcher.search(text) is not None
 
-        return True
+
+@register_filter("include_all")
+class IncludeAllFilter(RegexFilter):
+    def validate(self, text):
+        return self.matcher.match_all(text)
+
+
+@register_filter("exclude")
+class ExcludeFilter(RegexFilter):
+    def validate(self, text):
+        return self.matcher.search(text) is None
 
 
 def get_filter(config):
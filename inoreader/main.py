@@ -3,31 +3,38 @@ from __future__ import print_function, unicode_literals
 
 import codecs
 import csv
+import inspect
 import json
 import logging
 import os
 import re
 import sys
 import threading
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial, wraps
+from itertools import chain
 from logging.config import dictConfig
 from operator import itemgetter
 from queue import Queue
 from uuid import uuid4
 
 import click
+import requests
 import yaml
 from flask import Flask, request
 from requests_oauthlib import OAuth2Session
 from tabulate import tabulate
 
 from inoreader import InoreaderClient
+from inoreader.article import Article
 from inoreader.config import InoreaderConfigManager
 from inoreader.consts import DEFAULT_APPID, DEFAULT_APPKEY
 from inoreader.exception import APIError, NotLoginError
 from inoreader.filter import get_filter
-from inoreader.sim import InvIndex, sim_of
+from inoreader.plan import EditPlan
+from inoreader.sim import CompactInvIndex, InvIndex, LCSMatcher, LSHIndex, similarity_join
+from inoreader.store import ArticleStore
 from inoreader.utils import download_image
 
 APPID_ENV_NAME = "INOREADER_APP_ID"
@@ -198,11 +205,30 @@ def list_tags():
 
 
 @main.command("fetch-unread")
-@click.option("-f", "--folder", required=True, help="Folder which articles belong to")
+@click.option(
+    "-f",
+    "--folder",
+    required=True,
+    multiple=True,
+    help="Folder which articles belong to, can be specified multiple times",
+)
 @click.option("-t", "--tags", help="Tag(s) for filtering, separate with comma")
 @click.option(
     "--batch-size", type=int, default=50, help="Maximum number of articles per API request"
 )
+@click.option(
+    "--workers", type=int, default=4, help="Maximum number of folders fetched concurrently"
+)
+@click.option(
+    "--prefetch",
+    type=int,
+    default=0,
+    help="Number of pages to fetch in background while saving articles, default: 0",
+)
+@click.option(
+    "--store",
+    help="SQLite file to keep articles locally, only new articles are fetched from Inoreader",
+)
 @click.option("-o", "--outfile", required=True, help="Filename to save articles")
 @click.option(
     "--out-format",
@@ -211,14 +237,33 @@ def list_tags():
     help="Format of output file, default: json",
 )
 @catch_error
-def fetch_unread(folder, tags, batch_size, outfile, out_format):
+def fetch_unread(folder, tags, batch_size, workers, prefetch, store, outfile, out_format):
     """Fetch unread articles"""
     client = get_client()
 
     tag_list = [] if not tags else tags.split(",")
+    if store:
+        article_store = ArticleStore(store, client)
+        articles = chain.from_iterable(
+            article_store.fetch_articles(folder=name, tags=tag_list, unread=True) for name in folder
+        )
+    elif len(folder) == 1:
+        articles = client.fetch_unread(
+            folder=folder[0], tags=tag_list, n=batch_size, prefetch=prefetch
+        )
+    else:
+        articles = client.fetch_many(
+            [{"folder": name} for name in folder],
+            max_workers=workers,
+            tags=tag_list,
+            unread=True,
+            n=batch_size,
+            prefetch=prefetch,
+        )
+
     fout = codecs.open(outfile, mode="w", encoding="utf-8")
     writer = csv.writer(fout, delimiter=",") if out_format == "csv" else None
-    for idx, article in enumerate(client.fetch_unread(folder=folder, tags=tag_list, n=batch_size)):
+    for idx, article in enumerate(articles):
         if idx > 0 and (idx % 10) == 0:
             LOGGER.info("fetched %d articles", idx)
         title = article.title
@@ -256,48 +301,235 @@ def fetch_unread(folder, tags, batch_size, outfile, out_format):
 
 
 def apply_action(articles, client, action, tags):
+    results = []
     if action == "tag":
         for tag in tags.split(","):
-            client.add_tag(articles, tag)
+            results.append(client.add_tag(articles, tag))
 
         for article in articles:
             LOGGER.info("Add tags [%s] on article: %s", tags, article.title)
     elif action == "mark_as_read":
-        client.mark_as_read(articles)
+        results.append(client.mark_as_read(articles))
         for article in articles:
             LOGGER.info("Mark article as read: %s", article.title)
     elif action == "like":
-        client.mark_as_liked(articles)
+        results.append(client.mark_as_liked(articles))
         for article in articles:
             LOGGER.info("Mark article as liked: %s", article.title)
     elif action == "broadcast":
-        client.broadcast(articles)
+        results.append(client.broadcast(articles))
         for article in articles:
             LOGGER.info("Broadcast article: %s", article.title)
     elif action == "star":
-        client.mark_as_starred(articles)
+        results.append(client.mark_as_starred(articles))
         for article in articles:
             LOGGER.info("Starred article: %s", article.title)
     elif action == "unstar":
-        client.remove_starred(articles)
+        results.append(client.remove_starred(articles))
         for article in articles:
             LOGGER.info("Unstarred article: %s", article.title)
 
+    for result in results:
+        for article_id in result.failed:
+            LOGGER.warning("Failed to apply action '%s' on article: %s", action, article_id)
+
+
+def plan_action(plan, client, articles, action):
+    if action["type"] == "tag":
+        for tag in action["tags"].split(","):
+            plan.add(articles, client.GENERAL_TAG_TEMPLATE.format(tag))
+    elif action["type"] == "unstar":
+        plan.remove(articles, client.STARRED_TAG)
+    else:
+        label = {
+            "mark_as_read": client.READ_TAG,
+            "like": client.LIKED_TAG,
+            "star": client.STARRED_TAG,
+            "broadcast": client.BROADCAST_TAG,
+        }[action["type"]]
+        plan.add(articles, label)
+
+
+def rule_sources(rule):
+    if "folders" in rule:
+        return [{"folder": folder, "unread": True} for folder in rule["folders"]]
+
+    return [dict(articles_info) for articles_info in rule.get("articles", [])]
+
+
+def source_key(client, source):
+    """Key of a source, the same for sources which fetch the same articles"""
+    params = inspect.signature(client.fetch_articles).parameters
+    source = dict(
+        {name: param.default for name, param in params.items() if param.default is not param.empty},
+        **source,
+    )
+    if not source["tags"]:
+        source["stream_id"] = client.resolve_stream_id(source["stream_id"], source["folder"])
+        source["folder"] = None
+    return json.dumps(source, sort_keys=True, ensure_ascii=False)
+
+
+def fetch_sources(client, rules, store=None):
+    """Fetch every distinct source of rules only once
+
+    Return {source key: [article, ...]}, an article in multiple sources is the same object.
+    """
+    sources = OrderedDict()
+    for rule in rules:
+        for source in rule_sources(rule):
+            sources.setdefault(source_key(client, source), source)
+
+    keys = list(sources)
+    source_articles, shared = {key: [] for key in keys}, {}
+    if store:
+        articles = (
+            (index, article)
+            for index, source in enumerate(sources.values())
+            for article in store.fetch_articles(**source)
+        )
+    else:
+        articles = client.fetch_many(list(sources.values()), with_stream=True)
+
+    for index, article in articles:
+        article = shared.setdefault(article.id, article)
+        source_articles[keys[index]].append(article)
+
+    LOGGER.info("fetched %d articles from %d sources", len(shared), len(keys))
+    return source_articles
+
+
+def rule_fields(rule):
+    return [
+        field for field in rule.get("fields", ["title", "content"]) if field in ("title", "content")
+    ]
+
+
+def build_rule_filters(rules):
+    return [(rule["name"], get_filter(rule["filter"]), rule_fields(rule)) for rule in rules]
+
+
+def match_articles(rule_filters, items):
+    """Return `(rule index, article id)` of `(article, rule indexes)` items matched by rules"""
+    matches = []
+    for article, rule_indexes in items:
+        for index in rule_indexes:
+            name, cur_filter, fields = rule_filters[index]
+            for field in fields:
+                text = article.title if field == "title" else article.text
+                if not cur_filter.validate(text):
+                    continue
+
+                if LOGGER.isEnabledFor(logging.DEBUG):
+                    LOGGER.debug(
+                        "article '%s' matched patterns %s of filter named '%s'",
+                        article.title,
+                        cur_filter.matched_patterns(text),
+                        name,
+                    )
+                matches.append((index, article.id))
+                break
+
+    return matches
+
+
+_WORKER_RULE_FILTERS = None
+
+
+def init_filter_worker(rules):
+    global _WORKER_RULE_FILTERS
+    _WORKER_RULE_FILTERS = build_rule_filters(rules)
+
+
+def match_shard(shard):
+    """Match `(article id, title, content, rule indexes)` items in a worker process"""
+    items = [
+        (Article(article_id, title, None, None, content=content, feed_title=""), rule_indexes)
+        for article_id, title, content, rule_indexes in shard
+    ]
+    return match_articles(_WORKER_RULE_FILTERS, items)
+
+
+def match_rules(rules, rule_articles, workers=1):
+    """Return the set of matched article ids of each rule
+
+    With `workers > 1`, articles are split into shards matched by a process pool, each worker
+    gets the title and/or content of an article only if a rule of the article needs them.
+    """
+    articles, article_rules = OrderedDict(), OrderedDict()
+    for index, rule_article in enumerate(rule_articles):
+        for article in rule_article.values():
+            articles.setdefault(article.id, article)
+            article_rules.setdefault(article.id, []).append(index)
+
+    rules = [
+        {"name": rule["name"], "filter": rule["filter"], "fields": rule_fields(rule)}
+        for rule in rules
+    ]
+    if workers <= 1 or len(articles) <= 1:
+        matches = match_articles(
+            build_rule_filters(rules),
+            [(article, article_rules[article.id]) for article in articles.values()],
+        )
+    else:
+        items = []
+        for article in articles.values():
+            indexes = article_rules[article.id]
+            fields = {field for index in indexes for field in rules[index]["fields"]}
+            items.append(
+                (
+                    article.id,
+                    article.title if "title" in fields else "",
+                    article.content if "content" in fields else "",
+                    indexes,
+                )
+            )
+
+        shard_size = -(-len(items) // (workers * 4))
+        shards = [items[start : start + shard_size] for start in range(0, len(items), shard_size)]
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_filter_worker, initargs=(rules,)
+        ) as executor:
+            matches = list(chain.from_iterable(executor.map(match_shard, shards)))
+
+    rule_matches = [set() for _ in rules]
+    for index, article_id in matches:
+        rule_matches[index].add(article_id)
+
+    return rule_matches
+
 
 @main.command("filter")
 @click.option("-r", "--rules-file", required=True, help="YAML file with your rules")
+@click.option("--dry-run", is_flag=True, help="Show what would be done without doing it")
+@click.option(
+    "--store",
+    help="SQLite file to keep articles locally, only new articles are fetched from Inoreader",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of processes to match articles with rules, default: 1",
+)
 @catch_error
-def filter_articles(rules_file):
+def filter_articles(rules_file, dry_run, store, workers):
     """Select articles and do something"""
     client = get_client()
-    matched_articles = defaultdict(list)
-    for rule in yaml.load(open(rules_file), Loader=yaml.Loader):
-        fields = [
-            field
-            for field in rule.get("fields", ["title", "content"])
-            if field in ("title", "content")
-        ]
-        cur_filter = get_filter(rule["filter"])
+    plan = EditPlan()
+    rules = yaml.load(open(rules_file), Loader=yaml.Loader)
+    article_store = ArticleStore(store, client) if store else None
+    source_articles = fetch_sources(client, rules, article_store)
+    rule_articles = []
+    for rule in rules:
+        articles = OrderedDict()
+        for source in rule_sources(rule):
+            for article in source_articles[source_key(client, source)]:
+                articles.setdefault(article.id, article)
+        rule_articles.append(articles)
+
+    rule_matches = match_rules(rules, rule_articles, workers)
+    for rule, articles, matched_ids in zip(rules, rule_articles, rule_matches):
         actions = []
         # only 'mark_as_read', 'like', 'star', 'broadcast', 'tag' is supported now
         for action in rule.get("actions", [{"type": "mark_as_read"}]):
@@ -312,26 +544,11 @@ def filter_articles(rules_file):
                 continue
             actions.append(action)
 
-        articles = []
-        if "folders" in rule:
-            for folder in rule["folders"]:
-                articles.extend(client.fetch_unread(folder=folder))
-        else:
-            for articles_info in rule.get("articles", []):
-                articles.extend(client.fetch_articles(**articles_info))
-
-        # FIXME: deduplicate
         count = 0
-        for article in articles:
-            matched = False
-            if "title" in fields and cur_filter.validate(article.title):
-                matched = True
-            if "content" in fields and cur_filter.validate(article.text):
-                matched = True
-
-            if matched:
+        for article in articles.values():
+            if article.id in matched_ids:
                 for action in actions:
-                    matched_articles[action["type"]].append((article, action))
+                    plan_action(plan, client, [article], action)
 
                 count += 1
 
@@ -341,13 +558,14 @@ def filter_articles(rules_file):
             rule["name"],
         )
 
-    for action_name in matched_articles:
-        articles, actions = zip(*matched_articles[action_name])
-        if action_name != "tag":
-            apply_action(articles, client, action_name, None)
-        else:
-            for article, action in zip(articles, actions):
-                apply_action([article], client, "tag", action["tags"])
+    if dry_run:
+        output_info = [["Label", "Operation", "Articles"]] + plan.summary()
+        print(tabulate(output_info, headers="firstrow", tablefmt="github"))
+        return
+
+    result = plan.execute(client)
+    for article_id in result.failed:
+        LOGGER.warning("Failed to edit labels of article: %s", article_id)
 
 
 @main.command("get-subscriptions")
@@ -398,6 +616,16 @@ def get_subscriptions(outfile, folder, out_format):
     "--batch-size", type=int, default=50, help="Maximum number of articles per API request"
 )
 @click.option("--only-unread", is_flag=True, help="Fetch unread articles only")
+@click.option(
+    "--prefetch",
+    type=int,
+    default=0,
+    help="Number of pages to fetch in background while saving articles, default: 0",
+)
+@click.option(
+    "--store",
+    help="SQLite file to keep articles locally, only new articles are fetched from Inoreader",
+)
 @click.option("-o", "--outfile", required=True, help="Filename to save results")
 @click.option(
     "--out-format",
@@ -406,9 +634,17 @@ def get_subscriptions(outfile, folder, out_format):
     help="Format of output, default: json",
 )
 @catch_error
-def fetch_articles(outfile, stream_id, batch_size, only_unread, out_format):
+def fetch_articles(outfile, stream_id, batch_size, only_unread, prefetch, store, out_format):
     """Fetch articles by stream id"""
     client = get_client()
+    if store:
+        articles = ArticleStore(store, client).fetch_articles(
+            stream_id=stream_id, unread=only_unread
+        )
+    else:
+        articles = client.fetch_articles(
+            stream_id=stream_id, n=batch_size, unread=only_unread, prefetch=prefetch
+        )
 
     fout = codecs.open(outfile, mode="w", encoding="utf-8")
     writer = None
@@ -416,9 +652,7 @@ def fetch_articles(outfile, stream_id, batch_size, only_unread, out_format):
         writer = csv.DictWriter(fout, ["title", "content"], delimiter=",", quoting=csv.QUOTE_ALL)
         writer.writeheader()
 
-    for idx, article in enumerate(
-        client.fetch_articles(stream_id=stream_id, n=batch_size, unread=only_unread)
-    ):
+    for idx, article in enumerate(articles):
         if idx > 0 and (idx % 10) == 0:
             LOGGER.info("fetched %d articles", idx)
 
@@ -444,24 +678,128 @@ def fetch_articles(outfile, stream_id, batch_size, only_unread, out_format):
     fout.close()
 
 
+def exact_duplicates(articles, thresh, method="cosine"):
+    """Return articles similar to an earlier article which is not a duplicate itself"""
+    pairs = similarity_join(
+        [article.title for article in articles], thresh, method=method, ngram_range=(2, 3)
+    )
+    similar = defaultdict(list)
+    for idx1, idx2, score in pairs:
+        similar[idx2].append((score, idx1))
+
+    duplicates = set()
+    for idx, article in enumerate(articles):
+        originals = [(score, other) for score, other in similar[idx] if other not in duplicates]
+        if not originals:
+            continue
+
+        _, original = max(originals)
+        print(
+            "article 「{}」 is duplicate with  -> 「{}」".format(
+                article.title, articles[original].title
+            )
+        )
+        duplicates.add(idx)
+
+    LOGGER.info("fetched %d articles and found %d duplicate", len(articles), len(duplicates))
+    return [articles[idx] for idx in sorted(duplicates)]
+
+
 @main.command()
 @click.option("-f", "--folder", help="Folder you want to deduplicate")
 @click.option("-t", "--thresh", type=float, default=0.8, help="Minimum similarity score")
+@click.option(
+    "--store",
+    help="SQLite file to keep articles locally, only new articles are fetched from Inoreader",
+)
+@click.option(
+    "-m",
+    "--method",
+    type=click.Choice(["cosine", "jaccard", "lcs"]),
+    default="cosine",
+    help="Similarity of titles, `lcs` is the longest common subsequence of chars, default: cosine",
+)
+@click.option(
+    "--index",
+    "index_type",
+    type=click.Choice(["inverted", "lsh", "exact"]),
+    default="inverted",
+    help=(
+        "Index to find similar titles, `lsh` is approximate but faster, `exact` compares all "
+        "titles at once with a similarity join, default: inverted"
+    ),
+)
+@click.option(
+    "--index-file",
+    help="File to keep the inverted index of titles across runs, to find duplicates of "
+    "articles deduplicated before",
+)
+@click.option(
+    "--keep-days",
+    type=int,
+    default=7,
+    help="Days of articles kept in `--index-file`, by published time, default: 7",
+)
+@click.option("--max-docs", type=int, help="Maximum number of articles kept in `--index-file`")
+@click.option(
+    "--max-df",
+    type=int,
+    help="3-grams in more titles than this don't add candidates of the inverted index, "
+    "which keeps lookups fast in large indexes",
+)
 @catch_error
-def dedupe(folder, thresh):
+def dedupe(folder, thresh, store, method, index_type, index_file, keep_days, max_docs, max_df):
     """Deduplicate articles"""
+    if index_file and index_type != "inverted":
+        click.secho("`--index-file` only works with the inverted index!", fg="red")
+        return -1
+    if method == "lcs" and index_type == "exact":
+        click.secho("`--method lcs` doesn't work with the exact index!", fg="red")
+        return -1
+
     client = get_client()
-    matched_articles, index = [], InvIndex()
-    for idx, article in enumerate(client.fetch_unread(folder=folder)):
+    if store:
+        articles = ArticleStore(store, client).fetch_articles(folder=folder, unread=True)
+    else:
+        articles = client.fetch_unread(folder=folder)
+
+    if index_type == "exact":
+        matched_articles = exact_duplicates(list(articles), thresh, method)
+        apply_action(matched_articles, client, "mark_as_read", None)
+        return
+
+    matched_articles = []
+    if index_type == "lsh":
+        index = LSHIndex(store_vectors=True)
+    else:
+        index = InvIndex(store_vectors=True)
+    if index_file:
+        index = CompactInvIndex(store_vectors=True)
+        if os.path.exists(index_file):
+            index.load(index_file)
+        evicted = index.evict(max_age=keep_days * 86400, max_docs=max_docs)
+        LOGGER.info("loaded %d articles from %s, evicted %d", len(index), index_file, evicted)
+
+    for idx, article in enumerate(articles):
         if idx > 0 and (idx % 10) == 0:
             LOGGER.info("fetched %d articles and found %d duplicate", idx, len(matched_articles))
 
-        related = index.retrieve(article.title, k=10)
+        if index_type == "inverted":
+            related = index.retrieve(article.title, k=10, max_df=max_df)
+        else:
+            related = index.retrieve(article.title, k=10)
         sims = Counter()
+        if method == "lcs":
+            matcher = LCSMatcher(article.title)
+        else:
+            query_vector = index.query_vector(article.title)
         for docid, doc, _ in related:
             if docid == article.id:
                 continue
-            sims[doc] = sim_of(doc, article.title, method="cosine", term="char", ngram_range=(2, 3))
+            if method == "lcs":
+                sims[doc] = matcher.score(doc, min_score=thresh)
+            else:
+                sims[doc] = index.score(query_vector, docid, method)
 
         if sims and max(sims.values()) >= thresh:
             top_doc, top_score = sims.most_common()[0]
@@ -473,6 +811,9 @@ def dedupe(folder, thresh):
 
     LOGGER.info("fetched %d articles and found %d duplicate", idx + 1, len(matched_articles))
     apply_action(matched_articles, client, "mark_as_read", None)
+    if index_file:
+        index.evict(max_docs=max_docs)
+        index.save(index_file)
 
 
 @main.command("fetch-starred")
@@ -517,6 +858,8 @@ def fetch_starred(folder, tags, batch_size, outfile, outdir, limit, save_image,
 
     tag_list = [] if not tags else tags.split(",")
     url_to_image = {}
+    # don't reuse the session of client, its auth headers shouldn't be sent to image hosts
+    image_session = requests.Session() if save_image else None
     fetched_count = 0
     for article in client.fetch_starred(folder=folder, tags=tag_list, limit=limit, n=batch_size):
         if limit and fetched_count >= limit:
@@ -560,7 +903,12 @@ def fetch_starred(folder, tags, batch_size, outfile, outdir, limit, save_image,
                     image_filename = str(uuid4()).replace("-", "")
 
                 return_image_file = download_image(
-                    image_url, outdir, image_filename, proxies=client.proxies
+                    image_url,
+                    outdir,
+                    image_filename,
+                    proxies=client.proxies,
+                    session=image_session,
+                    timeout=client.timeout,
                 )
                 if return_image_file:
                     LOGGER.info('Download image as "%s" from "%s"', return_image_file, image_url)
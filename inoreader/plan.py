@@ -0,0 +1,92 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import logging
+import re
+from collections import OrderedDict, defaultdict
+
+from .writer import EditTagResult
+
+LOGGER = logging.getLogger(__name__)
+
+ADD, REMOVE, CONFLICT = "add", "remove", "conflict"
+
+
+def normalize_label(label):
+    """`user/1005921515/label/foo` -> `user/-/label/foo`"""
+    return re.sub(r"^user/\d+/", "user/-/", label)
+
+
+class EditPlan(object):
+    """Collect label edits on articles and send them with the minimum number of `edit-tag` calls
+
+    Edits are grouped by (label, operation), duplicated ids are merged, edits which don't change
+    anything (adding a label the article already has, removing one it doesn't have) are dropped,
+    and so are conflicting edits (adding and removing the same label on the same article).
+    """
+
+    def __init__(self):
+        self._articles = OrderedDict()
+        self._edits = defaultdict(OrderedDict)
+
+    def _record(self, articles, label, operation):
+        label = normalize_label(label)
+        for article in articles:
+            self._articles[article.id] = article
+            edits = self._edits[article.id]
+            current = edits.get(label)
+            if current is None:
+                edits[label] = operation
+            elif current != operation:
+                edits[label] = CONFLICT
+
+    def add(self, articles, label):
+        self._record(articles, label, ADD)
+
+    def remove(self, articles, label):
+        self._record(articles, label, REMOVE)
+
+    def batches(self):
+        """Return {(label, operation): [article_id, ...]}"""
+        batches = OrderedDict()
+        for article_id, edits in self._edits.items():
+            categories = {
+                normalize_label(category)
+                for category in self._articles[article_id].categories or []
+            }
+            for label, operation in edits.items():
+                if operation == CONFLICT:
+                    LOGGER.warning(
+                        "Skip conflicting edits of label '%s' on article: %s", label, article_id
+                    )
+                    continue
+                if (operation == ADD) == (label in categories):
+                    continue
+
+                batches.setdefault((label, operation), []).append(article_id)
+
+        return batches
+
+    def summary(self):
+        return [
+            [label, operation, len(article_ids)]
+            for (label, operation), article_ids in self.batches().items()
+        ]
+
+    def execute(self, client):
+        result = EditTagResult()
+        for (label, operation), article_ids in self.batches().items():
+            if operation == ADD:
+                result.merge(client.edit_tag(article_ids, add=label))
+            else:
+                result.merge(client.edit_tag(article_ids, remove=label))
+
+            for article_id in article_ids:
+                LOGGER.info(
+                    "%s label '%s' on article: %s",
+                    "Add" if operation == ADD else "Remove",
+                    label,
+                    self._articles[article_id].title,
+                )
+
+        return result
@@ -0,0 +1,139 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import logging
+import time
+from threading import Lock
+
+from .exception import RateLimitError
+
+LOGGER = logging.getLogger(__name__)
+
+# reference: https://www.inoreader.com/developers/rate-limiting
+READ_ZONE = 1  # most of read operations
+WRITE_ZONE = 2  # edit-tag, subscription/edit and other insert operations
+
+
+class ZoneBudget(object):
+    __slots__ = ("limit", "usage", "remaining", "reset_at", "in_flight")
+
+    def __init__(self):
+        self.limit = None
+        self.usage = None
+        # unknown until the first response of the zone
+        self.remaining = None
+        self.reset_at = None
+        # reserved requests without response yet, not counted in `usage` of server
+        self.in_flight = 0
+
+    def to_dict(self):
+        return {
+            "limit": self.limit,
+            "usage": self.usage,
+            "remaining": self.remaining,
+            "reset_at": self.reset_at,
+            "in_flight": self.in_flight,
+        }
+
+
+class RateLimiter(object):
+    """Track the request budget of each zone with the usage headers of Inoreader responses
+
+    Requests go at full speed while the zone has remaining budget. When it's used up, requests
+    wait until the limits are reset, or `RateLimitError` is raised if the reset is more than
+    `max_wait` seconds away.
+
+    Each request reserved with `acquire`/`wait_time` must be released with `release` once it
+    gets a response or fails, the budget left is the limit minus the usage on server and the
+    requests still in flight.
+    """
+
+    HEADER_TEMPLATES = {
+        "limit": "X-Reader-Zone{}-Limit",
+        "usage": "X-Reader-Zone{}-Usage",
+    }
+    RESET_HEADER = "X-Reader-Limits-Reset-After"
+
+    def __init__(self, max_wait=60):
+        self.max_wait = max_wait
+        self.zones = {READ_ZONE: ZoneBudget(), WRITE_ZONE: ZoneBudget()}
+        self.lock = Lock()
+
+    def update(self, headers):
+        with self.lock:
+            self._update(headers)
+
+    def release(self, zone, headers=None):
+        """Release a request reserved in the zone, with the headers of its response if any"""
+        with self.lock:
+            budget = self.zones[zone]
+            budget.in_flight = max(0, budget.in_flight - 1)
+            if headers:
+                self._update(headers)
+
+    def _update(self, headers):
+        now = time.time()
+        reset_after = headers.get(self.RESET_HEADER)
+        for zone, budget in self.zones.items():
+            limit = headers.get(self.HEADER_TEMPLATES["limit"].format(zone))
+            usage = headers.get(self.HEADER_TEMPLATES["usage"].format(zone))
+            if limit is None or usage is None:
+                continue
+
+            budget.limit, budget.usage = int(limit), int(usage)
+            budget.remaining = max(0, budget.limit - budget.usage - budget.in_flight)
+            if reset_after is not None:
+                budget.reset_at = now + float(reset_after)
+
+    def exhaust(self, zone, headers=None):
+        """Mark the zone as used up, called when the server responds 429"""
+        if headers:
+            self.update(headers)
+        with self.lock:
+            self.zones[zone].remaining = 0
+
+    def wait_time(self, zone):
+        """Reserve one request of the zone, or return seconds to wait before trying again"""
+        now = time.time()
+        with self.lock:
+            budget = self.zones[zone]
+            if budget.reset_at and now >= budget.reset_at:
+                budget.remaining, budget.usage, budget.reset_at = None, 0, None
+
+            if budget.remaining is None:
+                budget.in_flight += 1
+                return 0
+            if budget.remaining > 0:
+                budget.remaining -= 1
+                budget.in_flight += 1
+                return 0
+
+            if budget.reset_at is None:
+                # no reset time from server, try again later
+                budget.reset_at = now + self.max_wait
+            wait = budget.reset_at - now
+            if wait > self.max_wait:
+                raise RateLimitError(
+                    "rate limit of zone {} exceeded, reset after {:.0f} seconds".format(zone, wait)
+                )
+            return max(wait, 0.1)
+
+    def try_acquire(self, zone):
+        """Reserve one request of the zone if it has budget now, never wait"""
+        try:
+            return not self.wait_time(zone)
+        except RateLimitError:
+            return False
+
+    def acquire(self, zone):
+        while True:
+            wait = self.wait_time(zone)
+            if not wait:
+                return
+
+            LOGGER.info("rate limit of zone %d reached, wait %.1f seconds", zone, wait)
+            time.sleep(wait)
+
+    def budget(self):
+        with self.lock:
+            return {"zone{}".format(zone): budget.to_dict() for zone, budget in self.zones.items()}
@@ -1,8 +1,25 @@
+import heapq
+import mmap
+import os
 import pickle
+import random
 import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
 from collections import Counter, defaultdict
-from difflib import SequenceMatcher
-from math import sqrt
+from functools import lru_cache
+from math import ceil, sqrt
+from operator import itemgetter
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency
+    np = sparse = None
 
 PUNCTS_PAT = re.compile(
     r'(?:[#\$&@.,;:!?，。！？、：；  \u3300\'`"~_\+\-\*\/\\|\\^=<>\[\]\(\)\{\}（）“”‘’\s]|'
@@ -13,115 +30,337 @@ PUNCTS_PAT = re.compile(
 )
 
 
-def make_terms(text, term, ngram_range=None, lower=True, ignore_punct=True, gram_as_tuple=False):
+@lru_cache(maxsize=1)
+def punct_chars():
+    """Chars matched by `PUNCTS_PAT`, all of them are in the BMP"""
+    return frozenset(chr(code) for code in range(0x10000) if PUNCTS_PAT.match(chr(code)))
+
+
+def _term_seq(text, term, lower):
     if lower:
         text = text.lower()
     if term == "word":
-        # term_seq = [word.strip() for word in jieba.cut(text) if word.strip()]
-        term_seq = [word.strip() for word in text.split() if word.strip()]
-    elif term == "char":
-        term_seq = list(re.sub(r"\s", "", text))
+        # return [word.strip() for word in jieba.cut(text) if word.strip()]
+        return text.split()
+    if term == "char":
+        # same as removing `\s`, a str keeps char grams as slices of it
+        return "".join(text.split())
+
+    raise ValueError(f"unsupported term type: {term}")
+
+
+def _next_puncts(term_seq, ignore_punct, gram_as_tuple):
+    """Return `next_puncts` where `next_puncts[idx]` is the index of the first punctuation
+    term at or after `idx`, a gram `term_seq[idx:end]` has no punctuation if it is `>= end`
+    """
+    size = len(term_seq)
+    next_puncts = [size] * (size + 1)
+    if not ignore_punct:
+        return next_puncts
+
+    puncts = punct_chars()
+    if isinstance(term_seq, str):
+        is_punct = puncts.__contains__
+    elif gram_as_tuple:
+        # words of a tuple gram are matched with `PUNCTS_PAT` from their first char
+        def is_punct(word):
+            return word[0] in puncts
+
     else:
-        raise ValueError(f"unsupported term type: {term}")
+        # words of a str gram are joined, any of their chars counts
+        def is_punct(word):
+            return not puncts.isdisjoint(word)
+
+    for idx in range(size - 1, -1, -1):
+        next_puncts[idx] = idx if is_punct(term_seq[idx]) else next_puncts[idx + 1]
+
+    return next_puncts
 
+
+def _check_ngram_range(ngram_range):
     if ngram_range and not (len(ngram_range) == 2 and ngram_range[0] < ngram_range[1]):
         raise ValueError(f"wrong `ngram_range`: {ngram_range}")
 
+
+def make_terms(text, term, ngram_range=None, lower=True, ignore_punct=True, gram_as_tuple=False):
+    """Return n-grams of chars or words of the text, without the ones with punctuation
+
+    For each position, the grams of all levels of `ngram_range` starting at it are emitted in
+    order, the ones past the end of the text are truncated and emitted once. A text shorter
+    than the minimum level gives the whole text as its only gram.
+    """
+    term_seq = _term_seq(text, term, lower)
+    _check_ngram_range(ngram_range)
+    next_puncts = _next_puncts(term_seq, ignore_punct, gram_as_tuple)
+    if gram_as_tuple:
+        make_gram = tuple
+    elif isinstance(term_seq, str):
+        make_gram = None
+    else:
+        make_gram = "".join
+
     terms = []
+    size = len(term_seq)
     min_ngram, max_ngram = ngram_range or (1, 2)
-    for idx in range(0, max(1, len(term_seq) - min_ngram + 1)):
-        cur_grams = []
+    for idx in range(0, max(1, size - min_ngram + 1)):
+        last_end, next_punct = None, next_puncts[idx]
         for gram_level in range(min_ngram, max_ngram):
-            if gram_as_tuple:
-                gram = tuple(term_seq[idx : idx + gram_level])
-            else:
-                gram = "".join(term_seq[idx : idx + gram_level])
-            if gram not in cur_grams:
-                if ignore_punct and any(PUNCTS_PAT.match(item) for item in gram):
-                    pass
-                else:
-                    cur_grams.append(gram)
-        terms.extend(cur_grams)
+            end = min(idx + gram_level, size)
+            # longer grams are the same truncated gram, or have the same punctuation
+            if end == last_end or next_punct < end:
+                break
+            gram = term_seq[idx:end]
+            terms.append(make_gram(gram) if make_gram else gram)
+            last_end = end
     return terms
 
 
+def tokenize(text, term="word", ngram_range=None, lower=True, ignore_punct=True):
+    """Return `{level: terms}` for each n-gram level of `ngram_range`, in one pass
+
+    The terms of a level are the same as `make_terms(text, term, (level, level + 1))`, this is
+    what the similarity functions split texts into, they accept the result in place of a text.
+    """
+    term_seq = _term_seq(text, term, lower)
+    _check_ngram_range(ngram_range)
+    next_puncts = _next_puncts(term_seq, ignore_punct, False)
+    make_gram = None if isinstance(term_seq, str) else "".join
+
+    levels = {}
+    size = len(term_seq)
+    for level in range(*(ngram_range or (1, 2))):
+        if size < level:
+            grams = [term_seq] if next_puncts[0] >= size else []
+        else:
+            grams = [
+                term_seq[idx : idx + level]
+                for idx in range(size - level + 1)
+                if next_puncts[idx] >= idx + level
+            ]
+        levels[level] = [make_gram(gram) for gram in grams] if make_gram else grams
+    return levels
+
+
+def _tokenized(text, term, ngram_range, lower, ignore_punct):
+    if isinstance(text, dict):
+        return text
+    return tokenize(text, term, ngram_range, lower, ignore_punct)
+
+
+def _level_weights(ngram_range, ngram_weights):
+    if not ngram_range or ngram_range[1] == ngram_range[0] + 1:
+        return None
+    weights = ngram_weights or list(range(*ngram_range))
+    weights_sum = sum(weights)
+    return [weight / weights_sum for weight in weights]
+
+
+def _popcount(bits):
+    return bin(bits).count("1")
+
+
+class LCSMatcher(object):
+    """Longest common subsequence of the chars of a query and of other texts
+
+    The LCS is computed bit-parallel (Hyyrö's algorithm): a bit vector over the chars of the
+    query, kept in a Python int, is updated with a few int operations for each char of the
+    other text, instead of filling a row of the dynamic programming table.
+
+    :param query: text, or its terms from `make_terms(query, "char", None, lower, ignore_punct)`
+    """
+
+    def __init__(self, query, lower=True, ignore_punct=True):
+        self.lower = lower
+        self.ignore_punct = ignore_punct
+        self.terms = self._terms(query)
+        # bits of the positions of each char in the query
+        self.masks = {}
+        for idx, term in enumerate(self.terms):
+            self.masks[term] = self.masks.get(term, 0) | (1 << idx)
+        self.all_bits = (1 << len(self.terms)) - 1
+
+    def _terms(self, text):
+        if isinstance(text, str):
+            return make_terms(text, "char", None, self.lower, self.ignore_punct)
+        return text
+
+    def lcs(self, text, min_length=0):
+        """Length of the LCS of the query and the text, None if it is less than `min_length`
+
+        The text is dropped as soon as its remaining chars can't make the LCS long enough.
+        """
+        terms = self._terms(text)
+        size = len(self.terms)
+        if min(size, len(terms)) < min_length:
+            return None
+
+        masks, all_bits, bits = self.masks, self.all_bits, self.all_bits
+        # only the last `min_length` chars can leave the LCS too short
+        check_from = len(terms) - min_length
+        for idx, term in enumerate(terms):
+            matched = bits & masks.get(term, 0)
+            bits = ((bits + matched) | (bits - matched)) & all_bits
+            if idx >= check_from and size - _popcount(bits) + len(terms) - idx - 1 < min_length:
+                return None
+
+        return size - _popcount(bits)
+
+    def score(self, text, min_score=None):
+        """`2 * LCS / (m + n)` of the query and the text, with lengths `m` and `n` in chars
+
+        Texts which can't reach `min_score` may be dropped early with a score of 0.0.
+        """
+        terms = self._terms(text)
+        total = len(self.terms) + len(terms)
+        if not total:
+            return 1.0
+
+        # allow for the rounding of `min_score`, a lower bound only drops less texts
+        min_length = max(0, ceil(min_score * total / 2 - 1e-9)) if min_score else 0
+        length = self.lcs(terms, min_length)
+        return 0.0 if length is None else 2 * length / total
+
+    def scores(self, texts, min_score=None):
+        """Scores of the query and each text, see `score`"""
+        return [self.score(text, min_score) for text in texts]
+
+
 def lcs_sim(
-    s1, s2, term="char", ngram_range=None, ngram_weights=None, lower=True, ignore_punct=True
+    s1,
+    s2,
+    term="char",
+    ngram_range=None,
+    ngram_weights=None,
+    lower=True,
+    ignore_punct=True,
+    min_score=None,
 ):
-    s1_terms = make_terms(s1, "char", None, lower, ignore_punct)
-    s2_terms = make_terms(s2, "char", None, lower, ignore_punct)
-    return SequenceMatcher(a=s1_terms, b=s2_terms).ratio()
+    """`2 * LCS / (m + n)` of chars of the texts, see `LCSMatcher.score`"""
+    return LCSMatcher(s1, lower, ignore_punct).score(s2, min_score)
 
 
 def jaccard_sim(
     s1, s2, term="word", ngram_range=None, ngram_weights=None, lower=True, ignore_punct=True
 ):
-    if not ngram_range or ngram_range[1] == ngram_range[0] + 1:
-        first_term_set = set(make_terms(s1, term, ngram_range, lower, ignore_punct))
-        second_term_set = set(make_terms(s2, term, ngram_range, lower, ignore_punct))
+    """Jaccard similarity of term sets, averaged over n-gram levels with `ngram_weights`
+
+    `s1`/`s2` can also be the result of `tokenize` with the same params, to split a text once
+    and compare it with many others.
+    """
+    first_levels = _tokenized(s1, term, ngram_range, lower, ignore_punct)
+    second_levels = _tokenized(s2, term, ngram_range, lower, ignore_punct)
+    scores = []
+    for ngram_level, first_terms in first_levels.items():
+        first_term_set = set(first_terms)
+        second_term_set = set(second_levels[ngram_level])
         if not first_term_set and not second_term_set:
-            return 1.0
-        return len(first_term_set & second_term_set) / len(first_term_set | second_term_set)
-    else:
-        weights = ngram_weights or list(range(*ngram_range))
-        weights_sum = sum(weights)
-        weights = [weight / weights_sum for weight in weights]
-        scores = []
-        for ngram_level in range(*ngram_range):
-            score = jaccard_sim(
-                s1,
-                s2,
-                term=term,
-                ngram_range=(ngram_level, ngram_level + 1),
-                lower=lower,
-                ignore_punct=ignore_punct,
+            scores.append(1.0)
+        else:
+            scores.append(
+                len(first_term_set & second_term_set) / len(first_term_set | second_term_set)
             )
-            scores.append(score)
 
-        return sum([score * weight for score, weight in zip(scores, weights)])
+    weights = _level_weights(ngram_range, ngram_weights)
+    if weights is None:
+        return scores[0]
+    return sum([score * weight for score, weight in zip(scores, weights)])
 
 
 def cosine_sim(
     s1, s2, term="word", ngram_range=None, ngram_weights=None, lower=True, ignore_punct=True
 ):
-    if not ngram_range or ngram_range[1] == ngram_range[0] + 1:
-        first_term_freq = Counter(make_terms(s1, term, ngram_range, lower, ignore_punct))
-        second_term_freq = Counter(make_terms(s2, term, ngram_range, lower, ignore_punct))
+    """Cosine similarity of term frequencies, averaged over n-gram levels with `ngram_weights`
+
+    `s1`/`s2` can also be the result of `tokenize`, see `jaccard_sim`.
+    """
+    first_levels = _tokenized(s1, term, ngram_range, lower, ignore_punct)
+    second_levels = _tokenized(s2, term, ngram_range, lower, ignore_punct)
+    scores = []
+    for ngram_level, first_terms in first_levels.items():
+        first_term_freq = Counter(first_terms)
+        second_term_freq = Counter(second_levels[ngram_level])
 
         first_norm = 0
         second_norm = 0
         inner_product = 0
 
-        for term, freq in first_term_freq.items():
+        for gram, freq in first_term_freq.items():
             first_norm += freq**2
-            inner_product += freq * second_term_freq[term]
+            inner_product += freq * second_term_freq[gram]
 
         for _, freq in second_term_freq.items():
             second_norm += freq**2
 
         if first_norm == 0 and second_norm == 0:
+            scores.append(1.0)
+        elif first_norm == 0 or second_norm == 0:
+            scores.append(0.0)
+        else:
+            scores.append(inner_product / sqrt(first_norm * second_norm))
+
+    weights = _level_weights(ngram_range, ngram_weights)
+    if weights is None:
+        return scores[0]
+    return sum([score * weight for score, weight in zip(scores, weights)])
+
+
+def term_vector(text, term="char", ngram_range=(2, 3), lower=True, ignore_punct=True):
+    """Return `({term: frequency}, norm)` of the text, see `vector_sim`"""
+    freqs = dict(Counter(make_terms(text, term, ngram_range, lower, ignore_punct)))
+    return freqs, sqrt(sum(freq * freq for freq in freqs.values()))
+
+
+def vector_sim(vector1, vector2, method="cosine"):
+    """Similarity of two term vectors, the same as `cosine_sim`/`jaccard_sim` of their texts"""
+    (freqs1, norm1), (freqs2, norm2) = vector1, vector2
+    if len(freqs1) > len(freqs2):
+        freqs1, freqs2 = freqs2, freqs1
+    if method == "cosine":
+        if norm1 == 0 and norm2 == 0:
             return 1.0
-        if first_norm == 0 or second_norm == 0:
+        if norm1 == 0 or norm2 == 0:
             return 0.0
+        inner_product = sum(freq * freqs2.get(term, 0) for term, freq in freqs1.items())
+        return inner_product / (norm1 * norm2)
+    if method == "jaccard":
+        if not freqs1 and not freqs2:
+            return 1.0
+        common = sum(1 for term in freqs1 if term in freqs2)
+        return common / (len(freqs1) + len(freqs2) - common)
 
-        return inner_product / sqrt(first_norm * second_norm)
-    else:
-        weights = ngram_weights or list(range(*ngram_range))
-        weights_sum = sum(weights)
-        weights = [weight / weights_sum for weight in weights]
-        scores = []
-        for ngram_level in range(*ngram_range):
-            score = cosine_sim(
-                s1,
-                s2,
-                term=term,
-                ngram_range=(ngram_level, ngram_level + 1),
-                lower=lower,
-                ignore_punct=ignore_punct,
-            )
-            scores.append(score)
+    raise ValueError("unsupported method: {}".format(method))
+
+
+class TermVectors(object):
+    """Term vectors of indexed docs, to score docs against a query vector
 
-        return sum([score * weight for score, weight in zip(scores, weights)])
+    :param term: term type of `make_terms`
+    :param ngram_range: one n-gram level of `make_terms`
+    :param store: keep the vector of a doc once computed, to reuse it for all queries
+    """
+
+    def __init__(self, term="char", ngram_range=(2, 3), store=True):
+        self.term = term
+        self.ngram_range = ngram_range
+        self.store = store
+        self.vectors = {}
+
+    def vector(self, text):
+        return term_vector(text, self.term, self.ngram_range)
+
+    def get(self, doc_id, text):
+        vector = self.vectors.get(doc_id)
+        if vector is None:
+            vector = self.vector(text)
+            if self.store:
+                self.vectors[doc_id] = vector
+        return vector
+
+    def remove(self, doc_id):
+        self.vectors.pop(doc_id, None)
+
+    def score(self, query_vector, doc_id, text, method="cosine"):
+        return vector_sim(query_vector, self.get(doc_id, text), method)
 
 
 def sim_of(s1, s2, method="cosine", term="word", ngram_range=None, lower=True, ignore_punct=True):
@@ -138,11 +377,76 @@ def sim_of(s1, s2, method="cosine", term="word", ngram_range=None, lower=True, i
     )
 
 
+def sorted_contains(postings, doc):
+    """Whether a sorted posting list contains the doc"""
+    idx = bisect_left(postings, doc)
+    return idx < len(postings) and postings[idx] == doc
+
+
+def intersect_postings(postings, docs):
+    """Docs of `docs`, a set or dict, in a posting list which is a set or a sorted sequence"""
+    if isinstance(postings, (set, frozenset)):
+        return postings.intersection(docs)
+    # read the posting list, or binary search each doc in it
+    if len(postings) <= len(docs) * len(postings).bit_length():
+        return [doc for doc in postings if doc in docs]
+    return [doc for doc in docs if sorted_contains(postings, doc)]
+
+
+def top_k_postings(postings, k, max_df=None, exclude=None):
+    """Return top `k` of `(doc, number of posting lists with the doc)`
+
+    Posting lists are read from the rarest to the most common. Once no doc outside of the
+    candidates can reach the top `k` with the lists left, or the lists left are longer than
+    `max_df`, the lists left only raise the scores of candidates which can still reach the top
+    `k`, see `intersect_postings`.
+
+    :param postings: posting lists, sets or sorted sequences
+    :param exclude: docs never returned, such as removed docs
+    """
+    postings = sorted(postings, key=len)
+    scores = Counter()
+    # scores are at most `idx`, so the k-th score can't reach `left` before half of the lists
+    next_check = (len(postings) + 1) // 2
+    for idx, posting in enumerate(postings):
+        left = len(postings) - idx
+        if max_df and len(posting) > max_df:
+            break
+        if idx >= next_check and len(scores) >= k:
+            kth = heapq.nlargest(k, scores.values())[-1]
+            if kth >= left:
+                break
+            # the k-th score and `left` get closer by at most 2 per list
+            next_check = idx + (left - kth + 1) // 2
+
+        if exclude:
+            scores.update(doc for doc in posting if doc not in exclude)
+        else:
+            scores.update(posting)
+    else:
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+    if len(scores) >= k:
+        kth = heapq.nlargest(k, scores.values())[-1]
+        scores = Counter({doc: score for doc, score in scores.items() if score + left >= kth})
+    for posting in postings[idx:]:
+        scores.update(intersect_postings(posting, scores))
+
+    return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+
 class InvIndex(object):
-    def __init__(self):
-        """build inverted index with ngram method"""
+    def __init__(self, store_vectors=False, term="char", ngram_range=(2, 3)):
+        """build inverted index with ngram method
+
+        :param store_vectors: compute the term vector of each doc when it is added and save it
+                              with the index, instead of on each `score`
+        :param term: term type of vectors
+        :param ngram_range: n-gram level of vectors
+        """
         self._id2doc = {}
         self._index = defaultdict(set)
+        self.vectors = TermVectors(term, ngram_range, store=store_vectors)
 
     def add_doc(self, doc):
         if doc.id in self._id2doc:
@@ -152,20 +456,696 @@ class InvIndex(object):
         terms = set(make_terms(doc.title, "char", (3, 4)))
         for term in terms:
             self._index[term].add(doc.id)
+        if self.vectors.store:
+            self.vectors.get(doc.id, doc.title)
 
         return True
 
-    def retrieve(self, query, k=10):
-        related = Counter()
+    def query_vector(self, query):
+        """Term vector of the query, computed once to `score` all its candidates"""
+        return self.vectors.vector(query)
+
+    def score(self, query_vector, doc_id, method="cosine"):
+        """Same as `sim_of` the query and the doc, with the vector of the query"""
+        return self.vectors.score(query_vector, doc_id, self._id2doc[doc_id], method)
+
+    def retrieve(self, query, k=10, max_df=None):
+        """Return top `k` of `(doc id, doc, number of common 3-grams)`
+
+        :param max_df: 3-grams in more docs than this don't add candidates, see `top_k_postings`
+        """
         terms = set(make_terms(query, "char", (3, 4)))
-        for term in terms:
-            for qid in self._index.get(term, []):
-                related[qid] += 1
+        postings = [self._index[term] for term in terms if term in self._index]
+        return [
+            (idx, self._id2doc[idx], score) for idx, score in top_k_postings(postings, k, max_df)
+        ]
+
+    def save(self, fname):
+        data = (self._id2doc, self._index)
+        if self.vectors.store:
+            data += (self.vectors.term, self.vectors.ngram_range, self.vectors.vectors)
+        pickle.dump(data, open(fname, "wb"))
+
+    def load(self, fname):
+        data = pickle.load(open(fname, "rb"))
+        self._id2doc, self._index = data[:2]
+        if len(data) > 2:
+            # vectors saved with the index
+            self.vectors = TermVectors(data[2], data[3])
+            self.vectors.vectors = data[4]
+
+
+class CompactInvIndex(object):
+    """Inverted index of char 3-grams with integer doc ids and array-backed posting lists
+
+    Docs are numbered in the order they are added, so posting lists of `array("I")` stay sorted.
+    `save` writes a versioned binary file which `load` memory-maps, terms and doc ids are found
+    by binary search in the file and only the posting lists of query terms are read, docs added
+    after `load` are kept in memory until the next `save`.
+
+    Removed docs are skipped by `retrieve` and dropped from the file by the next `save`, which
+    renumbers the remaining docs. Each doc has a unix time, its `published` time if it has one
+    or the time it was added, to evict old docs with `evict`.
+
+    Term vectors for `score` are kept in memory only, by doc id, with `store_vectors`.
+
+    File layout, all integers are little-endian uint32 and each section is padded to 4 bytes:
+
+        header: magic, version, doc count, term count, byte sizes of id/title/term blobs,
+                posting count
+        id offsets (doc count + 1), title offsets (doc count + 1), times (doc count),
+        id order (doc count, docnos sorted by the utf-8 bytes of their ids), term offsets
+        (term count + 1), posting offsets (term count + 1), postings, id blob, title blob,
+        term blob (terms sorted by their utf-8 bytes)
+    """
+
+    MAGIC = b"INOIDX\x00\x00"
+    VERSION = 3
+    HEADER = struct.Struct("<8s7I")
+
+    def __init__(self, store_vectors=False, term="char", ngram_range=(2, 3)):
+        self._mmap = None
+        self.vectors = TermVectors(term, ngram_range, store=store_vectors)
+        self._clear()
+
+    def _clear(self):
+        # docs added in memory
+        self._doc_ids = []
+        self._titles = []
+        self._docnos = {}
+        self._times = array("I")
+        self._postings = defaultdict(lambda: array("I"))
+        # docs in the memory-mapped file
+        self._base_count = 0
+        self._sections = {}
+        self._deleted = set()
+
+    def __len__(self):
+        return self._doc_count() - len(self._deleted)
+
+    def _doc_count(self):
+        """Number of docnos used, including removed docs"""
+        return self._base_count + len(self._doc_ids)
+
+    def _base_section(self, name, start, end):
+        offsets = self._sections[name + "_offsets"]
+        return bytes(self._sections[name + "_blob"][offsets[start] : offsets[end]])
+
+    def doc_id(self, docno):
+        if docno < self._base_count:
+            return self._base_section("id", docno, docno + 1).decode("utf-8")
+        return self._doc_ids[docno - self._base_count]
+
+    def title(self, docno):
+        if docno < self._base_count:
+            return self._base_section("title", docno, docno + 1).decode("utf-8")
+        return self._titles[docno - self._base_count]
+
+    def doc_time(self, docno):
+        if docno < self._base_count:
+            return self._sections["times"][docno]
+        return self._times[docno - self._base_count]
+
+    def docno(self, doc_id):
+        # a removed doc of the file may be added again in memory, with a new docno
+        docno = self._docnos.get(doc_id)
+        if docno is None and self._sections:
+            docno = self._find("id", doc_id, self._sections["id_order"])
+        return None if docno in self._deleted else docno
+
+    def _find(self, name, string, order=None):
+        """Binary search the string in a string section of the file, sorted or in `order`"""
+        offsets, blob = self._sections[name + "_offsets"], self._sections[name + "_blob"]
+        string, count = string.encode("utf-8"), len(offsets) - 1
+
+        def encoded(idx):
+            if order is not None:
+                idx = order[idx]
+            return bytes(blob[offsets[idx] : offsets[idx + 1]])
+
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            if encoded(mid) < string:
+                low = mid + 1
+            else:
+                high = mid
 
-        return [(idx, self._id2doc[idx], score) for idx, score in related.most_common(k)]
+        if low == count or encoded(low) != string:
+            return None
+        return low if order is None else order[low]
+
+    def _base_postings(self, term):
+        if not self._sections:
+            return ()
+
+        idx = self._find("term", term)
+        if idx is None:
+            return ()
+
+        offsets = self._sections["posting_offsets"]
+        return self._sections["postings"][offsets[idx] : offsets[idx + 1]]
+
+    def postings(self, term):
+        """Sorted docnos of docs with the term"""
+        base = self._base_postings(term)
+        added = self._postings.get(term)
+        if not added:
+            return base
+        return list(base) + list(added) if base else added
+
+    def add_doc(self, doc):
+        if self.docno(doc.id) is not None:
+            return False
+
+        docno = self._doc_count()
+        self._docnos[doc.id] = docno
+        self._doc_ids.append(doc.id)
+        self._titles.append(doc.title)
+        self._times.append(int(getattr(doc, "published", None) or time.time()))
+        for term in set(make_terms(doc.title, "char", (3, 4))):
+            self._postings[term].append(docno)
+
+        return True
+
+    def remove_doc(self, doc_id):
+        docno = self.docno(doc_id)
+        if docno is None:
+            return False
+
+        self._deleted.add(docno)
+        self.vectors.remove(doc_id)
+        return True
+
+    def evict(self, max_age=None, max_docs=None, now=None):
+        """Remove docs older than `max_age` seconds, then the oldest docs beyond `max_docs`
+
+        Return the number of removed docs.
+        """
+        docnos = [docno for docno in range(self._doc_count()) if docno not in self._deleted]
+        docnos.sort(key=lambda docno: (self.doc_time(docno), docno))
+        evicted = 0
+        if max_age is not None:
+            oldest = (now or time.time()) - max_age
+            while evicted < len(docnos) and self.doc_time(docnos[evicted]) < oldest:
+                evicted += 1
+        if max_docs is not None:
+            evicted = max(evicted, len(docnos) - max_docs)
+
+        self._deleted.update(docnos[:evicted])
+        for docno in docnos[:evicted]:
+            self.vectors.remove(self.doc_id(docno))
+        return evicted
+
+    def retrieve(self, query, k=10, max_df=None):
+        """Same as `InvIndex.retrieve`"""
+        postings = [self.postings(term) for term in set(make_terms(query, "char", (3, 4)))]
+        top_k = top_k_postings(
+            [posting for posting in postings if len(posting)],
+            k,
+            max_df,
+            exclude=self._deleted,
+        )
+        return [(self.doc_id(docno), self.title(docno), score) for docno, score in top_k]
+
+    def query_vector(self, query):
+        """Same as `InvIndex.query_vector`"""
+        return self.vectors.vector(query)
+
+    def score(self, query_vector, doc_id, method="cosine"):
+        """Same as `InvIndex.score`"""
+        return self.vectors.score(query_vector, doc_id, self.title(self.docno(doc_id)), method)
+
+    def _terms(self):
+        terms = set(self._postings)
+        if self._sections:
+            offsets, blob = self._sections["term_offsets"], self._sections["term_blob"]
+            terms.update(
+                bytes(blob[offsets[idx] : offsets[idx + 1]]).decode("utf-8")
+                for idx in range(len(offsets) - 1)
+            )
+        return sorted(terms, key=lambda term: term.encode("utf-8"))
+
+    @staticmethod
+    def _pack_strings(strings):
+        offsets, blob = array("I", [0]), bytearray()
+        for string in strings:
+            blob += string.encode("utf-8")
+            offsets.append(len(blob))
+        return offsets, bytes(blob)
 
     def save(self, fname):
-        pickle.dump((self._id2doc, self._index), open(fname, "wb"))
+        docnos = [docno for docno in range(self._doc_count()) if docno not in self._deleted]
+        renumbered = {docno: new_docno for new_docno, docno in enumerate(docnos)}
+        doc_ids = [self.doc_id(docno) for docno in docnos]
+        id_offsets, id_blob = self._pack_strings(doc_ids)
+        id_order = array("I", sorted(range(len(doc_ids)), key=lambda idx: doc_ids[idx].encode()))
+        title_offsets, title_blob = self._pack_strings(self.title(docno) for docno in docnos)
+        times = array("I", [self.doc_time(docno) for docno in docnos])
+        terms, term_postings = [], []
+        for term in self._terms():
+            term_docnos = [
+                renumbered[docno] for docno in self.postings(term) if docno in renumbered
+            ]
+            if term_docnos:
+                terms.append(term)
+                term_postings.append(term_docnos)
+        term_offsets, term_blob = self._pack_strings(terms)
+        posting_offsets, postings = array("I", [0]), array("I")
+        for term_docnos in term_postings:
+            postings.extend(term_docnos)
+            posting_offsets.append(len(postings))
+
+        sections = [
+            id_offsets,
+            title_offsets,
+            times,
+            id_order,
+            term_offsets,
+            posting_offsets,
+            postings,
+        ]
+        if sys.byteorder != "little":
+            for section in sections:
+                section.byteswap()
+
+        header = self.HEADER.pack(
+            self.MAGIC,
+            self.VERSION,
+            len(renumbered),
+            len(terms),
+            len(id_blob),
+            len(title_blob),
+            len(term_blob),
+            len(postings),
+        )
+        # write a new file and replace the old one, which may be memory-mapped
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "wb") as f:
+            f.write(header)
+            for section in sections:
+                section.tofile(f)
+            for blob in (id_blob, title_blob, term_blob):
+                f.write(blob + b"\x00" * (-len(blob) % 4))
+
+        self.close()
+        os.replace(tmp_fname, fname)
+        self.load(fname)
 
     def load(self, fname):
-        self._id2doc, self._index = pickle.load(open(fname, "rb"))
+        with open(fname, "rb") as f:
+            magic = f.read(len(self.MAGIC))
+            if magic != self.MAGIC:
+                raise ValueError("not an index file: {}".format(fname))
+            f.seek(0)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        _, version, doc_count, term_count, *sizes = self.HEADER.unpack_from(mm)
+        if version != self.VERSION:
+            mm.close()
+            raise ValueError("unsupported index version: {}".format(version))
+
+        id_size, title_size, term_size, posting_count = sizes
+        view, pos = memoryview(mm), self.HEADER.size
+        sections = {}
+        for name, size in (
+            ("id_offsets", (doc_count + 1) * 4),
+            ("title_offsets", (doc_count + 1) * 4),
+            ("times", doc_count * 4),
+            ("id_order", doc_count * 4),
+            ("term_offsets", (term_count + 1) * 4),
+            ("posting_offsets", (term_count + 1) * 4),
+            ("postings", posting_count * 4),
+            ("id_blob", id_size),
+            ("title_blob", title_size),
+            ("term_blob", term_size),
+        ):
+            section = view[pos : pos + size]
+            if not name.endswith("_blob"):
+                section = section.cast("I")
+                if sys.byteorder != "little":
+                    section = array("I", section)
+                    section.byteswap()
+            sections[name] = section
+            pos += size + (-size % 4)
+
+        self.close()
+        self._mmap, self._sections, self._base_count = mm, sections, doc_count
+
+    def close(self):
+        """Release the memory-mapped file and clear the index"""
+        for section in self._sections.values():
+            if isinstance(section, memoryview):
+                section.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+        self._clear()
+
+
+class LSHIndex(object):
+    MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(self, bands=16, rows=4, seed=1, store_vectors=False):
+        """build locality-sensitive hashing index with MinHash signatures of char 3-grams
+
+        Two titles with Jaccard similarity `s` of their 3-grams share a bucket in at least one
+        band with probability `1 - (1 - s ** rows) ** bands`, more bands raise recall and more
+        rows raise precision, the similarity where it is 0.5 is about `(1 / bands) ** (1 / rows)`.
+
+        Term vectors of `store_vectors` are kept in memory only, see `InvIndex.score`.
+        """
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self._hash_params = [
+            (rng.randrange(1, self.MERSENNE_PRIME), rng.randrange(0, self.MERSENNE_PRIME))
+            for _ in range(bands * rows)
+        ]
+        self._id2doc = {}
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self.vectors = TermVectors(store=store_vectors)
+
+    def signature(self, text):
+        """MinHash signature of 3-grams of the text, None if it has no 3-gram"""
+        # crc32 is stable across processes, unlike `hash` of str
+        hashes = [
+            zlib.crc32(term.encode("utf-8")) for term in set(make_terms(text, "char", (3, 4)))
+        ]
+        if not hashes:
+            return None
+
+        prime = self.MERSENNE_PRIME
+        return tuple(min([(a * h + b) % prime for h in hashes]) for a, b in self._hash_params)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows]
+
+    def add_doc(self, doc):
+        if doc.id in self._id2doc:
+            return False
+
+        signature = self.signature(doc.title)
+        self._id2doc[doc.id] = (doc.title, signature)
+        if signature is not None:
+            for band, key in self._band_keys(signature):
+                self._buckets[band][key].add(doc.id)
+
+        return True
+
+    def retrieve(self, query, k=10):
+        """Return top `k` of `(doc id, doc, estimated Jaccard similarity)` sharing a bucket"""
+        signature = self.signature(query)
+        if signature is None:
+            return []
+
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        results = []
+        for docid in candidates:
+            doc, doc_signature = self._id2doc[docid]
+            score = sum(x == y for x, y in zip(signature, doc_signature)) / len(signature)
+            results.append((docid, doc, score))
+
+        return sorted(results, key=lambda result: result[2], reverse=True)[:k]
+
+    def query_vector(self, query):
+        """Same as `InvIndex.query_vector`"""
+        return self.vectors.vector(query)
+
+    def score(self, query_vector, doc_id, method="cosine"):
+        """Same as `InvIndex.score`"""
+        return self.vectors.score(query_vector, doc_id, self._id2doc[doc_id][0], method)
+
+    def save(self, fname):
+        pickle.dump(
+            (self.bands, self.rows, self._hash_params, self._id2doc, self._buckets),
+            open(fname, "wb"),
+        )
+
+    def load(self, fname):
+        data = pickle.load(open(fname, "rb"))
+        self.bands, self.rows, self._hash_params, self._id2doc, self._buckets = data
+
+
+def _min_overlap(method, thresh, size1, size2):
+    """Minimum number of common terms of two term sets to reach `thresh`"""
+    if method == "jaccard":
+        overlap = thresh / (1 + thresh) * (size1 + size2)
+    else:
+        overlap = thresh * sqrt(size1 * size2)
+
+    # tolerate float errors, a smaller overlap only keeps more candidates
+    return max(1, int(ceil(overlap - 1e-9)))
+
+
+def similarity_join(
+    texts,
+    thresh,
+    method="jaccard",
+    term="char",
+    ngram_range=(2, 3),
+    lower=True,
+    ignore_punct=True,
+):
+    """Find all pairs of texts whose similarity of term sets is at least `thresh`
+
+    Terms are ordered from the rarest to the most common, and only pairs sharing a term in the
+    prefixes of their sorted terms are scored (prefix filtering), the prefix length depends on
+    `thresh` and set sizes (length filtering), and candidates are dropped as soon as the rest of
+    their terms can't reach the required overlap (positional filtering), see PPJoin.
+
+    Scores are the same as `jaccard_sim`, or `cosine_sim` on term sets, with one n-gram level.
+
+    Return `[(index1, index2, score), ...]` with `index1 < index2`.
+    """
+    if method not in ("jaccard", "cosine"):
+        raise ValueError("unsupported method: {}".format(method))
+    if ngram_range and ngram_range[1] != ngram_range[0] + 1:
+        raise ValueError(f"only one n-gram level is supported: {ngram_range}")
+    if not 0 < thresh <= 1:
+        raise ValueError(f"wrong `thresh`: {thresh}")
+
+    term_sets = [set(make_terms(text, term, ngram_range, lower, ignore_punct)) for text in texts]
+    doc_freq = Counter(item for term_set in term_sets for item in term_set)
+    ranks = {
+        item: rank for rank, (item, _) in enumerate(sorted(doc_freq.items(), key=itemgetter(1, 0)))
+    }
+    records = [sorted(ranks[item] for item in term_set) for term_set in term_sets]
+
+    sizes = [len(record) for record in records]
+    results, empty = [], []
+    # {term rank: [(record index, position), ...]} of the indexed prefixes, and the number of
+    # records at the start of each list which are too short for all later records
+    index, skipped = defaultdict(list), defaultdict(int)
+    for idx in sorted(range(len(records)), key=sizes.__getitem__):
+        record, size = records[idx], sizes[idx]
+        if not size:
+            # empty term sets are the same
+            results.extend((min(other, idx), max(other, idx), 1.0) for other in empty)
+            empty.append(idx)
+            continue
+
+        min_size = thresh * size if method == "jaccard" else thresh * thresh * size
+        probe_prefix = size - _min_overlap(method, thresh, size, min_size) + 1
+        overlaps, required = {}, {}
+        for pos in range(probe_prefix):
+            postings = index[record[pos]]
+            start = skipped[record[pos]]
+            while start < len(postings) and sizes[postings[start][0]] < min_size - 1e-9:
+                start += 1
+            skipped[record[pos]] = start
+
+            for other, other_pos in postings[start:]:
+                count = overlaps.get(other, 0)
+                if count is None:
+                    continue
+
+                other_size = sizes[other]
+                if other_size not in required:
+                    required[other_size] = _min_overlap(method, thresh, size, other_size)
+                bound = count + 1 + min(size - pos - 1, other_size - other_pos - 1)
+                overlaps[other] = None if bound < required[other_size] else count + 1
+
+        for other, count in overlaps.items():
+            if count is None:
+                continue
+
+            common = len(term_sets[idx] & term_sets[other])
+            if method == "jaccard":
+                score = common / (size + sizes[other] - common)
+            else:
+                score = common / sqrt(size * sizes[other])
+            if score >= thresh:
+                results.append((min(other, idx), max(other, idx), score))
+
+        # records probing later are not smaller, which makes the indexed prefix shorter
+        index_prefix = size - _min_overlap(method, thresh, size, size) + 1
+        for pos in range(index_prefix):
+            index[record[pos]].append((idx, pos))
+
+    return sorted(results)
+
+
+def similarity_clusters(pairs, size=None):
+    """Group the indexes of similar pairs into clusters with union-find
+
+    :param pairs: `(index1, index2, ...)` tuples such as the results of `similarity_join`
+    :param size: also return single-item clusters of indexes in `range(size)` if given
+    """
+    parents = {}
+
+    def find(idx):
+        parents.setdefault(idx, idx)
+        while parents[idx] != idx:
+            parents[idx] = parents[parents[idx]]
+            idx = parents[idx]
+        return idx
+
+    for pair in pairs:
+        root1, root2 = find(pair[0]), find(pair[1])
+        if root1 != root2:
+            parents[max(root1, root2)] = min(root1, root2)
+
+    for idx in range(size or 0):
+        find(idx)
+
+    clusters = defaultdict(list)
+    for idx in sorted(parents):
+        clusters[find(idx)].append(idx)
+
+    return list(clusters.values())
+
+
+def _count_rows(texts, vocabularies, term, ngram_range, lower, ignore_punct):
+    """CSR arrays `(indptr, indices, data)` of term frequencies of texts at each n-gram level"""
+    rows = {level: ([0], [], []) for level in vocabularies}
+    for text in texts:
+        for level, terms in _tokenized(text, term, ngram_range, lower, ignore_punct).items():
+            indptr, indices, data = rows[level]
+            vocabulary, counts = vocabularies[level], Counter(terms)
+            indices.extend(vocabulary.setdefault(gram, len(vocabulary)) for gram in counts)
+            data.extend(counts.values())
+            indptr.append(len(indices))
+    return rows
+
+
+def _level_matrix(rows, size, method):
+    """Return the term matrix of a level to multiply for `method`, and its empty rows"""
+    indptr, indices, data = rows
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float64), indices, indptr), shape=(len(indptr) - 1, size)
+    )
+    if method == "cosine":
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        empty = norms == 0
+        norms[empty] = 1.0
+        return sparse.diags(1 / norms) @ matrix, empty
+
+    matrix.data[:] = 1.0
+    return matrix, np.diff(matrix.indptr) == 0
+
+
+def _empty_pairs(query_empty, doc_empty, weight):
+    """Score `weight` of pairs of texts without terms, which are equal"""
+    query_ids, doc_ids = np.flatnonzero(query_empty), np.flatnonzero(doc_empty)
+    return sparse.csr_matrix(
+        (
+            np.full(len(query_ids) * len(doc_ids), weight),
+            (np.repeat(query_ids, len(doc_ids)), np.tile(doc_ids, len(query_ids))),
+        ),
+        shape=(len(query_empty), len(doc_empty)),
+    )
+
+
+def sim_matrix(
+    queries,
+    docs=None,
+    method="cosine",
+    term="word",
+    ngram_range=None,
+    ngram_weights=None,
+    lower=True,
+    ignore_punct=True,
+    min_score=None,
+    block_size=1000,
+):
+    """Similarities of each query and each doc, as a SciPy sparse matrix of shape
+    `(len(queries), len(docs))`, requires NumPy and SciPy
+
+    Scores are the same as `cosine_sim`/`jaccard_sim` with the same params, but texts are
+    turned into sparse term vectors once and a block of queries is scored against all docs
+    with sparse matrix products. Pairs without common terms are left out of the matrix.
+
+    :param queries: texts, or results of `tokenize`
+    :param docs: texts, or results of `tokenize`, the queries themselves if not given
+    :param min_score: leave out pairs scored below it, to keep large matrices small; for
+                      clusters of similar texts, pass the upper triangle (`scipy.sparse.triu`)
+                      of the matrix of texts and themselves to `similarity_clusters`
+    :param block_size: number of queries scored at a time
+    """
+    if sparse is None:
+        raise ImportError(
+            "numpy and scipy are required by sim_matrix, "
+            "install them with `pip install python-inoreader[sim]`"
+        )
+    if method not in ("cosine", "jaccard"):
+        raise ValueError("unsupported method: {}".format(method))
+
+    queries = list(queries)
+    docs = queries if docs is None else list(docs)
+    _check_ngram_range(ngram_range)
+    levels = list(range(*(ngram_range or (1, 2))))
+    weights = _level_weights(ngram_range, ngram_weights) or [1.0]
+    vocabularies = {level: {} for level in levels}
+    params = (term, ngram_range, lower, ignore_punct)
+    query_rows = _count_rows(queries, vocabularies, *params)
+    doc_rows = query_rows if docs is queries else _count_rows(docs, vocabularies, *params)
+
+    # levels beyond the weights don't count, the same as `zip` of `cosine_sim`
+    query_levels, doc_levels = [], []
+    for level, weight in zip(levels, weights):
+        size = len(vocabularies[level])
+        query_levels.append(_level_matrix(query_rows[level], size, method) + (weight,))
+        doc_matrix, doc_empty = _level_matrix(doc_rows[level], size, method)
+        doc_levels.append((doc_matrix.T.tocsr(), doc_empty, np.diff(doc_matrix.indptr)))
+
+    if method == "cosine":
+        # the weighted sum of products of all levels is one product of the stacked matrices
+        query_matrix = sparse.hstack(
+            [matrix * weight for matrix, _, weight in query_levels], format="csr"
+        )
+        doc_matrix = sparse.vstack([doc_matrix for doc_matrix, _, _ in doc_levels], format="csr")
+
+    blocks = []
+    for start in range(0, len(queries), block_size):
+        stop = min(start + block_size, len(queries))
+        scores = []
+        if method == "cosine":
+            scores.append(query_matrix[start:stop] @ doc_matrix)
+        for (matrix, empty, weight), (level_doc_matrix, doc_empty, doc_sizes) in zip(
+            query_levels, doc_levels
+        ):
+            if method == "jaccard":
+                common = (matrix[start:stop] @ level_doc_matrix).tocoo()
+                query_sizes = np.diff(matrix.indptr[start : stop + 1])
+                common.data = common.data / (
+                    query_sizes[common.row] + doc_sizes[common.col] - common.data
+                )
+                scores.append(common.tocsr() * weight)
+            if empty[start:stop].any() and doc_empty.any():
+                scores.append(_empty_pairs(empty[start:stop], doc_empty, weight))
+
+        block = sum(scores[1:], scores[0]).tocsr()
+        if min_score is not None:
+            block.data[block.data < min_score] = 0
+        block.eliminate_zeros()
+        blocks.append(block)
+
+    if not blocks:
+        return sparse.csr_matrix((0, len(docs)))
+    return sparse.vstack(blocks, format="csr")
@@ -0,0 +1,215 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from .article import Article
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_STORE_FILE = os.path.join(os.environ.get("HOME"), ".inoreader.db")
+
+READ_STATE = "/state/com.google/read"
+STARRED_STATE = "/state/com.google/starred"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    categories TEXT,
+    link TEXT,
+    published INTEGER,
+    content TEXT,
+    author TEXT,
+    feed_id TEXT,
+    feed_title TEXT,
+    feed_link TEXT
+);
+CREATE TABLE IF NOT EXISTS stream_articles (
+    stream_id TEXT,
+    article_id TEXT,
+    PRIMARY KEY (stream_id, article_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    stream_id TEXT PRIMARY KEY,
+    with_read INTEGER,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_published ON articles (published);
+"""
+
+
+def has_state(categories, state):
+    return any(category.endswith(state) for category in categories)
+
+
+class ArticleStore(object):
+    """Local SQLite store of articles, synced incrementally with Inoreader
+
+    Each stream keeps the time its last sync started as sync cursor, a sync only fetches
+    articles which Inoreader got after the cursor (the `ot` param of stream contents, which is
+    compared with the crawl time of articles, not their published time) and then refreshes the
+    read and starred states of stored articles with the cheap item ids API.
+
+    The first sync of a stream fetches its unread articles only, unless `unread=False`.
+
+    :param overlap: seconds fetched again before the cursor, for clock skew and late crawls
+    """
+
+    ARTICLE_FIELDS = (
+        "id",
+        "title",
+        "categories",
+        "link",
+        "published",
+        "content",
+        "author",
+        "feed_id",
+        "feed_title",
+        "feed_link",
+    )
+
+    def __init__(self, path=DEFAULT_STORE_FILE, client=None, overlap=600):
+        self.path = path
+        self.client = client
+        self.overlap = overlap
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def cursor(self, stream_id):
+        row = self.conn.execute(
+            "SELECT synced_at, with_read FROM sync_state WHERE stream_id = ?", (stream_id,)
+        ).fetchone()
+        return row or (None, None)
+
+    def save(self, stream_id, articles):
+        count = 0
+        with self.conn:
+            for article in articles:
+                row = [getattr(article, field) for field in self.ARTICLE_FIELDS]
+                row[2] = json.dumps(list(article.categories or []))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+                )
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO stream_articles VALUES (?, ?)", (stream_id, article.id)
+                )
+                count += 1
+
+        return count
+
+    def _set_state(self, article_ids, state, tag, enabled):
+        with self.conn:
+            for article_id in article_ids:
+                row = self.conn.execute(
+                    "SELECT categories FROM articles WHERE id = ?", (article_id,)
+                ).fetchone()
+                categories = [
+                    category for category in json.loads(row[0]) if not category.endswith(state)
+                ]
+                if enabled:
+                    categories.append(tag)
+                self.conn.execute(
+                    "UPDATE articles SET categories = ? WHERE id = ?",
+                    (json.dumps(categories), article_id),
+                )
+
+    def refresh_states(self, stream_id):
+        """Update read and starred states of stored articles in the stream with the unread and
+        starred ids on server
+        """
+        unread_ids = set(self.client.fetch_item_ids(stream_id, unread=True))
+        starred_ids = set(self.client.fetch_item_ids(stream_id, unread=False, starred=True))
+        changes = {key: [] for key in ("read", "unread", "starred", "unstarred")}
+        for article_id, categories in self.conn.execute(
+            "SELECT a.id, a.categories FROM articles a JOIN stream_articles s "
+            "ON a.id = s.article_id WHERE s.stream_id = ?",
+            (stream_id,),
+        ).fetchall():
+            categories = json.loads(categories)
+            read = has_state(categories, READ_STATE)
+            if read == (article_id in unread_ids):
+                changes["unread" if read else "read"].append(article_id)
+            starred = has_state(categories, STARRED_STATE)
+            if starred != (article_id in starred_ids):
+                changes["unstarred" if starred else "starred"].append(article_id)
+
+        self._set_state(changes["read"], READ_STATE, self.client.READ_TAG, True)
+        self._set_state(changes["unread"], READ_STATE, self.client.READ_TAG, False)
+        self._set_state(changes["starred"], STARRED_STATE, self.client.STARRED_TAG, True)
+        self._set_state(changes["unstarred"], STARRED_STATE, self.client.STARRED_TAG, False)
+
+    def sync(self, stream_id, unread=True, n=100):
+        """Fetch articles of the stream added since the last sync, return the number of them"""
+        started = time.time()
+        synced_at, with_read = self.cursor(stream_id)
+        if not unread and not with_read:
+            # only unread articles are stored, fetch the stream again with read ones
+            synced_at = None
+        with_read = bool(with_read) or not unread
+
+        ot = int(synced_at - self.overlap) if synced_at is not None else None
+        articles = self.client.fetch_articles(
+            stream_id=stream_id, unread=synced_at is None and unread, n=n, ot=ot
+        )
+        count = self.save(stream_id, articles)
+        if synced_at is not None:
+            self.refresh_states(stream_id)
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                (stream_id, int(with_read), started),
+            )
+
+        LOGGER.debug("synced %d new articles of stream %s", count, stream_id)
+        return count
+
+    def query(self, stream_id, unread=True, starred=False, tags=None, limit=None):
+        """Read stored articles of the stream, newest first"""
+        rows = self.conn.execute(
+            "SELECT {} FROM articles a JOIN stream_articles s ON a.id = s.article_id "
+            "WHERE s.stream_id = ? ORDER BY a.published DESC".format(
+                ", ".join("a." + field for field in self.ARTICLE_FIELDS)
+            ),
+            (stream_id,),
+        )
+        count = 0
+        for row in rows:
+            data = dict(zip(self.ARTICLE_FIELDS, row))
+            data["categories"] = json.loads(data["categories"])
+            if unread and has_state(data["categories"], READ_STATE):
+                continue
+            if starred and not has_state(data["categories"], STARRED_STATE):
+                continue
+            if not self.client.match_tags(data, tags):
+                continue
+
+            yield Article(**data)
+            count += 1
+            if limit and count >= limit:
+                break
+
+    def fetch_articles(
+        self,
+        stream_id=None,
+        folder=None,
+        tags=None,
+        unread=True,
+        starred=False,
+        limit=None,
+        n=100,
+        **kwargs,
+    ):
+        """Same as `InoreaderClient.fetch_articles`, but sync the stream and read the store"""
+        stream_id = self.client.resolve_stream_id(stream_id, folder, tags)
+        stream_id = stream_id or self.client.READING_LIST_TAG
+        self.sync(stream_id, unread=unread, n=n)
+        return self.query(stream_id, unread=unread, starred=starred, tags=tags, limit=limit)
@@ -3,6 +3,17 @@
 
 
 class Subscription(object):
+    __slots__ = (
+        "id",
+        "title",
+        "categories",
+        "sortid",
+        "firstitemmsec",
+        "url",
+        "htmlUrl",
+        "iconUrl",
+    )
+
     def __init__(self, id, title, categories, sortid, firstitemmsec, url, htmlUrl, iconUrl):
         self.id = id
         self.title = title
@@ -1,9 +1,13 @@
 # coding: utf-8
 from __future__ import print_function, unicode_literals
 
+import codecs
+import json
 import os
 import re
 import shutil
+from queue import Full, Queue
+from threading import Event, Thread
 
 import requests
 from lxml import html
@@ -42,8 +46,9 @@ def extract_text(html_content):
         return ""
 
 
-def download_image(url, path, filename, proxies=None):
-    response = requests.get(url, stream=True, proxies=proxies)
+def download_image(url, path, filename, proxies=None, session=None, timeout=None):
+    """Download image from `url`, pass `session` to reuse its pooled connections"""
+    response = (session or requests).get(url, stream=True, proxies=proxies, timeout=timeout)
     if response.status_code not in (200, 201):
         return None
 
@@ -65,3 +70,129 @@ def download_image(url, path, filename, proxies=None):
         shutil.copyfileobj(response.raw, f)
 
     return image_filename
+
+
+def read_ahead(iterable, depth):
+    """Consume `iterable` in a background thread while the caller processes earlier items
+
+    At most `depth` items are buffered, the background thread waits when the buffer is full.
+    Exceptions raised by `iterable` are re-raised in the caller.
+    """
+    queue, stopped, done = Queue(maxsize=depth), Event(), object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as exception:
+            put(exception)
+        finally:
+            put(done)
+
+    Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = queue.get()
+            if item is done:
+                break
+            elif isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+class JSONStreamReader(object):
+    """Read JSON values one by one from chunks of a JSON document"""
+
+    WHITESPACES = " \t\n\r"
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buf, self.pos, self.eof = "", 0, False
+
+    def read(self):
+        chunk = next(self.chunks, None)
+        # drop consumed data
+        self.buf, self.pos = self.buf[self.pos :], 0
+        if chunk is None:
+            self.eof = True
+            self.buf += self.text_decoder.decode(b"", final=True)
+            return False
+
+        self.buf += self.text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACES:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.read():
+                raise ValueError("unexpected end of JSON data")
+
+    def expect(self, *chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("expect {} but got {!r}".format(" or ".join(chars), char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of buffer may be incomplete
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.read()
+
+
+def iter_json_items(chunks, key="items", meta=None):
+    """Yield elements of the array `key` of a JSON object, reading the object chunk by chunk
+
+    Other members of the object are saved in `meta`, they are complete only after all items
+    are consumed.
+    """
+    meta = {} if meta is None else meta
+    reader = JSONStreamReader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",", "]") == "]":
+                        break
+        else:
+            meta[name] = reader.value()
+
+        if reader.expect(",", "}") == "}":
+            return
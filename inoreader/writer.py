@@ -0,0 +1,95 @@
+# coding: utf-8
+from __future__ import print_function, unicode_literals
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .exception import NotLoginError, RateLimitError
+
+LOGGER = logging.getLogger(__name__)
+
+
+def chunked(items, size):
+    items = list(items)
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+class EditTagResult(object):
+    def __init__(self, succeeded=None, failed=None, errors=None):
+        self.succeeded = succeeded or []
+        self.failed = failed or []
+        # id -> the last exception raised by the request which contains the id
+        self.errors = errors or {}
+
+    def __bool__(self):
+        return not self.failed
+
+    def __repr__(self):
+        return "<EditTagResult succeeded={} failed={}>".format(
+            len(self.succeeded), len(self.failed)
+        )
+
+    def add_chunk(self, ids, exception=None):
+        if exception is None:
+            self.succeeded.extend(ids)
+        else:
+            self.failed.extend(ids)
+            self.errors.update((item_id, exception) for item_id in ids)
+
+    def merge(self, other):
+        self.succeeded.extend(other.succeeded)
+        self.failed.extend(other.failed)
+        self.errors.update(other.errors)
+        return self
+
+
+class EditTagWriter(object):
+    """Send `edit-tag` requests in chunks, with parallel in-flight requests and per-chunk retry
+
+    :param send: function called as `send(ids, add=..., remove=...)` to post one request
+    :param chunk_size: maximum number of ids per request
+    :param max_workers: maximum number of requests in flight
+    :param retries: times to retry a failed chunk
+    :param retry_delay: seconds to wait before the first retry, doubled on each retry
+    """
+
+    def __init__(self, send, chunk_size=10, max_workers=4, retries=2, retry_delay=1.0):
+        self.send = send
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def _send_chunk(self, ids, add, remove):
+        for attempt in range(self.retries + 1):
+            try:
+                self.send(ids, add=add, remove=remove)
+                return None
+            except (NotLoginError, RateLimitError):
+                raise
+            except Exception as exception:
+                if attempt >= self.retries:
+                    LOGGER.warning("failed to edit tags of %d articles: %r", len(ids), exception)
+                    return exception
+
+                LOGGER.debug("retry editing tags of %d articles: %r", len(ids), exception)
+                time.sleep(self.retry_delay * 2**attempt)
+
+    def edit(self, ids, add=None, remove=None):
+        result = EditTagResult()
+        chunks = chunked(ids, self.chunk_size)
+        if not chunks:
+            return result
+
+        if self.max_workers <= 1 or len(chunks) == 1:
+            for chunk in chunks:
+                result.add_chunk(chunk, self._send_chunk(chunk, add, remove))
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            errors = executor.map(lambda chunk: self._send_chunk(chunk, add, remove), chunks)
+            for chunk, exception in zip(chunks, errors):
+                result.add_chunk(chunk, exception)
+
+        return result